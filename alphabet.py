@@ -0,0 +1,77 @@
+"""
+Enigma alphabet definitions
+"""
+import string
+
+
+class Alphabet:
+    """
+    Ordered set of symbols an Enigma machine encrypts.
+    Components store their wiring as integer tables indexed by a symbol's
+    position in the alphabet, so the symbols themselves are only needed at
+    the edges (parsing input and formatting output).
+    """
+
+    def __init__(self, symbols, fold_case=False):
+        if len(set(symbols)) != len(symbols):
+            raise ValueError("Alphabet symbols must be unique")
+        if len(symbols) < 2 or len(symbols) % 2:
+            raise ValueError("Alphabet must contain an even number of symbols")
+        self.symbols = symbols
+        self.size = len(symbols)
+        self.fold_case = fold_case
+        self._indices = {symbol: index for index, symbol in enumerate(symbols)}
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, symbol):
+        return self.find(symbol) is not None
+
+    def find(self, symbol):
+        """Return the index of symbol, or None when it is not in the alphabet"""
+        index = self._indices.get(symbol)
+        if index is None and self.fold_case:
+            index = self._indices.get(symbol.upper())
+        return index
+
+    def index(self, symbol):
+        index = self.find(symbol)
+        if index is None:
+            raise ValueError(f"Symbol {symbol!r} is not in the alphabet")
+        return index
+
+    def symbol(self, index):
+        return self.symbols[index]
+
+
+UPPERCASE = Alphabet(string.ascii_uppercase, fold_case=True)
+ALPHANUMERIC = Alphabet(string.ascii_uppercase + string.digits, fold_case=True)
+# Latin-1 code points 0-255, so bytes map one-to-one onto symbols
+BYTES = Alphabet("".join(chr(i) for i in range(256)))
+
+ALPHABETS = {
+    "uppercase": UPPERCASE,
+    "alphanumeric": ALPHANUMERIC,
+    "bytes": BYTES,
+}
+
+
+def get_alphabet(name):
+    try:
+        return ALPHABETS[name]
+    except KeyError:
+        raise ValueError(f"Unknown alphabet '{name}', expected one of {', '.join(ALPHABETS)}") from None
+
+
+def alphabet_name(alphabet):
+    """Return the name alphabet is registered under, for formats that store it by name"""
+    for name, known in ALPHABETS.items():
+        if known is alphabet:
+            return name
+    raise ValueError(f"Expected one of the named alphabets: {', '.join(ALPHABETS)}")
+
+
+def byte_table(alphabet):
+    """Map each byte (read as Latin-1) to its alphabet index, None to pass it through"""
+    return [alphabet.find(chr(value)) for value in range(256)]
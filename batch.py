@@ -0,0 +1,104 @@
+"""
+Batch encryption of one message under many machine configurations
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+
+from alphabet import UPPERCASE
+from enigmamachine import EnigmaMachine
+
+
+@dataclass(frozen=True)
+class KeyConfig:
+    """
+    One key in a batch. Matches EnigmaMachine(num_rotors, seed, randomize_positions);
+    positions, when given, overrides the start position of every rotor.
+    """
+    seed: int | None
+    num_rotors: int = 3
+    positions: tuple[int, ...] | None = None
+    randomize_positions: bool = False
+
+
+class KeyBatch:
+    """
+    Wiring for a list of configurations, built once per distinct seed and
+    rotor count. Each configuration is still encrypted by its own pass over
+    the message; what the batch saves is setup. Configurations sharing wiring
+    share a cache of composed core tables, so sweeping start positions over
+    one seed only composes each rotor state once for the whole batch.
+    """
+
+    def __init__(self, configs: list[KeyConfig], alphabet=UPPERCASE) -> None:
+        self.alphabet = alphabet
+        self.configs = list(configs)
+        self._machines: dict[tuple, EnigmaMachine] = {}
+        self._core_caches: dict[tuple, dict] = {}
+        self._keys: list[tuple[tuple, list[int]]] = []
+        for index, config in enumerate(self.configs):
+            wiring_key = (config.seed, config.num_rotors, config.randomize_positions)
+            if config.seed is None:
+                # unseeded wiring is unique to this config
+                wiring_key += (index,)
+            machine = self._machines.get(wiring_key)
+            if machine is None:
+                machine = EnigmaMachine(
+                    num_rotors=config.num_rotors,
+                    randomize_positions=config.randomize_positions,
+                    alphabet=alphabet,
+                    rng=random.Random(config.seed),
+                )
+                self._machines[wiring_key] = machine
+                self._core_caches[wiring_key] = {}
+            self._keys.append((wiring_key, self._start_positions(machine, config)))
+
+    def _start_positions(self, machine: EnigmaMachine, config: KeyConfig) -> list[int]:
+        if config.positions is None:
+            return [rotor.initial_position for rotor in machine.rotors]
+        if len(config.positions) != machine.num_rotors:
+            raise ValueError(f"Expected {machine.num_rotors} rotor positions, got {len(config.positions)}")
+        return [position % self.alphabet.size for position in config.positions]
+
+    def machine(self, index: int) -> EnigmaMachine:
+        """Return a machine set to the start positions of config index"""
+        wiring_key, positions = self._keys[index]
+        machine = self._machines[wiring_key]
+        for rotor, position in zip(machine.rotors, positions):
+            rotor.current_position = position
+        return machine
+
+    def encrypt_indices(self, indices: list[int]) -> list[list[int]]:
+        """Encrypt indices under each configuration in turn, one output list per configuration"""
+        outputs = []
+        for index, (wiring_key, _) in enumerate(self._keys):
+            machine = self.machine(index)
+            outputs.append(machine.encrypt_indices(indices, self._core_caches[wiring_key]))
+            machine.reset_rotors()
+        return outputs
+
+    def encrypt(self, message: str | bytes) -> list[str] | list[bytes]:
+        """Encrypt message under every configuration, returning results in config order"""
+        if isinstance(message, (bytes, bytearray)):
+            if self.alphabet.size != 256:
+                raise ValueError("Encrypting bytes requires a 256-symbol alphabet")
+            return [bytes(output) for output in self.encrypt_indices(list(message))]
+
+        find = self.alphabet.find
+        symbols = self.alphabet.symbols
+        message_indices = [find(letter) for letter in message]
+        indices = [index for index in message_indices if index is not None]
+        results = []
+        for output in self.encrypt_indices(indices):
+            encrypted = iter(output)
+            results.append("".join(
+                letter if index is None else symbols[next(encrypted)]
+                for letter, index in zip(message, message_indices)
+            ))
+        return results
+
+
+def encrypt_batch(configs: list[KeyConfig], message: str | bytes, alphabet=UPPERCASE) -> list[str] | list[bytes]:
+    """Encrypt one message under many configurations at once"""
+    return KeyBatch(configs, alphabet=alphabet).encrypt(message)
@@ -0,0 +1,222 @@
+"""
+Bulk file encryption: encrypt a directory tree or glob of files on a worker pool
+"""
+from __future__ import annotations
+
+import glob
+import json
+import logging
+import mmap
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from alphabet import byte_table, get_alphabet
+from enigmamachine import EnigmaMachine
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".enigma-manifest.json"
+CHUNK_SIZE = 1 << 20
+# building one shared core table costs roughly what computing three in-line does
+CORE_BUILD_COST = 3
+
+
+@dataclass
+class FileResult:
+    path: str
+    size: int
+    mtime_ns: int
+    seconds: float
+    skipped: bool = False
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second, 0 when nothing was timed"""
+        return self.size / self.seconds if self.seconds else 0.0
+
+
+def encrypt_file(
+    source: str,
+    destination: str,
+    seed: int,
+    num_rotors: int = 3,
+    alphabet_name: str = "bytes",
+    tables_name: str | None = None,
+) -> FileResult:
+    """
+    Encrypt one file from the machine's start positions, reading it through
+    mmap. With tables_name the machine is built from tables published in
+    shared memory instead of from the seed.
+    """
+    if tables_name is None:
+        machine = EnigmaMachine(num_rotors=num_rotors, alphabet=get_alphabet(alphabet_name), rng=random.Random(seed))
+        return _encrypt_file(machine, None, source, destination)
+
+    from shared_tables import SharedTables
+    with SharedTables.attach(tables_name) as tables:
+        return _encrypt_file(tables.machine(), tables.core_cache, source, destination)
+
+
+def _encrypt_file(machine: EnigmaMachine, core_cache, source: str, destination: str) -> FileResult:
+    table = byte_table(machine.alphabet)
+    stat = os.stat(source)
+    Path(destination).parent.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    with open(source, "rb") as infile, open(destination, "wb") as outfile:
+        if stat.st_size:
+            with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for offset in range(0, len(data), CHUNK_SIZE):
+                    outfile.write(machine.encrypt_chunk(data[offset:offset + CHUNK_SIZE], table, core_cache))
+    seconds = time.perf_counter() - start
+    return FileResult(path=source, size=stat.st_size, mtime_ns=stat.st_mtime_ns, seconds=seconds)
+
+
+def collect_inputs(source: str) -> tuple[Path, list[Path]]:
+    """Return the root that output paths are made relative to, and the files to encrypt"""
+    path = Path(source)
+    if path.is_dir():
+        return path, sorted(item for item in path.rglob("*") if item.is_file())
+    if path.is_file():
+        return path.parent, [path]
+
+    # glob pattern: paths are relative to the part before the first wildcard
+    root_parts = []
+    for part in path.parts:
+        if glob.has_magic(part):
+            break
+        root_parts.append(part)
+    root = Path(*root_parts) if root_parts else Path(".")
+    matches = sorted(Path(item) for item in glob.glob(source, recursive=True))
+    return root, [item for item in matches if item.is_file()]
+
+
+def _load_manifest(manifest_path: Path) -> dict:
+    try:
+        return json.loads(manifest_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest(manifest_path: Path, manifest: dict) -> None:
+    temp_path = manifest_path.with_suffix(".tmp")
+    temp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(temp_path, manifest_path)
+
+
+def encrypt_tree(
+    source: str,
+    output_dir: str,
+    seed: int,
+    num_rotors: int = 3,
+    alphabet_name: str = "bytes",
+    workers: int | None = None,
+    force: bool = False,
+    share_tables: bool = False,
+) -> list[FileResult]:
+    """
+    Encrypt every file under source (a directory, file or glob) into output_dir.
+    Files whose size and mtime match the manifest from a previous run with the
+    same key are skipped unless force is set. With share_tables, the wiring is
+    compiled once into shared memory for the worker pool, along with every core
+    table when the pending files are large enough to repay building them.
+    """
+    get_alphabet(alphabet_name)  # fail fast on a bad name before starting workers
+    root, inputs = collect_inputs(source)
+    output_root = Path(output_dir)
+    output_root.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_root / MANIFEST_NAME
+    manifest = _load_manifest(manifest_path)
+    key = {"seed": seed, "numRotors": num_rotors, "alphabet": alphabet_name}
+
+    resolved_output = output_root.resolve()
+    results = []
+    pending = []
+    for input_path in inputs:
+        if input_path.name == MANIFEST_NAME or resolved_output in input_path.resolve().parents:
+            continue  # never re-encrypt our own output
+        relative = input_path.relative_to(root).as_posix()
+        destination = output_root / relative
+        stat = input_path.stat()
+        entry = manifest.get(relative)
+        if (
+            not force
+            and entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["key"] == key
+            and destination.exists()
+        ):
+            results.append(FileResult(str(input_path), stat.st_size, stat.st_mtime_ns, 0.0, skipped=True))
+            continue
+        pending.append((relative, str(input_path), str(destination), stat.st_size))
+
+    def record(relative: str, result: FileResult) -> None:
+        manifest[relative] = {"size": result.size, "mtime_ns": result.mtime_ns, "key": key}
+        results.append(result)
+        logger.info(
+            f"Encrypted {result.path}: {result.size} bytes in {result.seconds:.3f}s "
+            f"({result.throughput / 1e6:.2f} MB/s)"
+        )
+
+    try:
+        if workers == 1 or len(pending) <= 1:
+            for relative, input_path, destination, _ in pending:
+                record(relative, encrypt_file(input_path, destination, seed, num_rotors, alphabet_name))
+        else:
+            tables = None
+            if share_tables:
+                from shared_tables import SharedTables
+                machine = EnigmaMachine(
+                    num_rotors=num_rotors, alphabet=get_alphabet(alphabet_name), rng=random.Random(seed)
+                )
+                tables = SharedTables.publish(machine, include_cores=_cores_pay_off(machine, pending, workers))
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = {
+                        pool.submit(
+                            encrypt_file, input_path, destination, seed, num_rotors, alphabet_name,
+                            tables.name if tables else None,
+                        ): relative
+                        for relative, input_path, destination, _ in pending
+                    }
+                    for future in as_completed(futures):
+                        record(futures[future], future.result())
+            finally:
+                if tables is not None:
+                    tables.release()
+    finally:
+        # keep progress from completed files even if one fails
+        _save_manifest(manifest_path, manifest)
+    return results
+
+
+def _cores_pay_off(machine: EnigmaMachine, pending: list[tuple], workers: int | None) -> bool:
+    """
+    Whether to publish every core table. Each file computes one core table per
+    turn of the first rotor; building them all happens once, up front, while
+    the pool waits.
+    """
+    from shared_tables import cores_fit
+    if not cores_fit(machine):
+        return False
+    size = machine.alphabet.size
+    reached = sum(file_size // size + 1 for *_, file_size in pending)
+    parallel = min(workers or os.cpu_count() or 1, len(pending))
+    return reached >= CORE_BUILD_COST * parallel * size ** (machine.num_rotors - 1)
+
+
+def summarize(results: list[FileResult], wall_seconds: float) -> dict:
+    processed = [result for result in results if not result.skipped]
+    total_bytes = sum(result.size for result in processed)
+    return {
+        "files": len(processed),
+        "skipped": len(results) - len(processed),
+        "bytes": total_bytes,
+        "seconds": wall_seconds,
+        "throughput": total_bytes / wall_seconds if wall_seconds else 0.0,
+    }
@@ -0,0 +1,248 @@
+"""
+Seekable encrypted container.
+
+The plain text is encrypted as one continuous stream, but split into
+fixed-size blocks. A footer records, for each block, where it starts in the
+file and how many symbols had been encrypted before it (the rotor steps). To
+read a range, the reader resets the machine, advances it straight to the
+first block's rotor state and decrypts only the blocks covering the range.
+
+Bytes are read as Latin-1, like bulk encryption: with the "bytes" alphabet
+every byte is encrypted, otherwise bytes outside the alphabet pass through
+unchanged and do not step the rotors.
+
+File layout (little-endian):
+    header      CONTAINER_HEADER (magic, version, block size, alphabet name, rotors)
+    positions   uint32 start position per rotor
+    blocks      cipher text, block_size bytes per block (the last may be short)
+    index       INDEX_ENTRY per block: file offset, steps before the block
+    trailer     CONTAINER_TRAILER (index offset, block count, length, magic)
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import random
+import struct
+from pathlib import Path
+
+from alphabet import alphabet_name, byte_table, get_alphabet
+from enigmamachine import EnigmaMachine
+
+CONTAINER_MAGIC = b"ENIGSEEK"
+CONTAINER_VERSION = 2
+CONTAINER_HEADER = struct.Struct("<8sII16sI")
+INDEX_ENTRY = struct.Struct("<QQ")
+CONTAINER_TRAILER = struct.Struct("<QQQ8s")
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+
+def _positions_struct(num_rotors: int) -> struct.Struct:
+    return struct.Struct(f"<{num_rotors}I")
+
+
+def _start_positions(machine: EnigmaMachine) -> list[int]:
+    return [rotor.initial_position for rotor in machine.rotors]
+
+
+def _read_header(data) -> dict:
+    """Parse the header and start positions at the beginning of data"""
+    if len(data) < CONTAINER_HEADER.size:
+        raise ValueError("File is too short to be a container")
+    magic, version, block_size, alphabet, num_rotors = CONTAINER_HEADER.unpack_from(data)
+    if magic != CONTAINER_MAGIC:
+        raise ValueError("Not a container")
+    if version != CONTAINER_VERSION:
+        raise ValueError(f"Unsupported container version {version}")
+    positions = _positions_struct(num_rotors)
+    if len(data) < CONTAINER_HEADER.size + positions.size:
+        raise ValueError("File is too short to be a container")
+    return {
+        "blockSize": block_size,
+        "alphabet": alphabet.rstrip(b"\0").decode("ascii"),
+        "numRotors": num_rotors,
+        "positions": list(positions.unpack_from(data, CONTAINER_HEADER.size)),
+    }
+
+
+def _read_layout(data) -> tuple[dict, int, int, int]:
+    """Parse the header and trailer, returning (header, index offset, blocks, length)"""
+    header = _read_header(data)
+    if len(data) < CONTAINER_HEADER.size + CONTAINER_TRAILER.size:
+        raise ValueError("File is too short to be a container")
+    index_offset, blocks, length, trailer_magic = CONTAINER_TRAILER.unpack_from(
+        data, len(data) - CONTAINER_TRAILER.size
+    )
+    if trailer_magic != CONTAINER_MAGIC:
+        raise ValueError("Container was not closed properly")
+    return header, index_offset, blocks, length
+
+
+class ContainerWriter:
+    """
+    Encrypts data written to it into a container file. With append=True an
+    existing container is reopened (keeping its block size): the footer is
+    dropped, the machine is advanced to where the stream ended and writing
+    carries on from there.
+    """
+
+    def __init__(
+        self, path: str | Path, machine: EnigmaMachine, block_size: int = DEFAULT_BLOCK_SIZE, append: bool = False
+    ) -> None:
+        self.machine = machine
+        self._byte_table = byte_table(machine.alphabet)
+        self._passthrough = bytes(value for value, index in enumerate(self._byte_table) if index is None)
+        self._index: list[tuple[int, int]] = []
+        self.length = 0
+        self._steps = 0
+        name = alphabet_name(machine.alphabet)
+
+        if append and os.path.exists(path) and os.path.getsize(path):
+            self._file = open(path, "r+b")
+            self._file.seek(0)
+            head = self._file.read(CONTAINER_HEADER.size + _positions_struct(machine.num_rotors).size)
+            self._file.seek(-CONTAINER_TRAILER.size, os.SEEK_END)
+            header, index_offset, blocks, self.length = _read_layout(head + self._file.read())
+            if (
+                header["alphabet"] != name
+                or header["numRotors"] != machine.num_rotors
+                or header["positions"] != _start_positions(machine)
+            ):
+                self._file.close()
+                raise ValueError("Container was written with a different machine configuration")
+            self.block_size = header["blockSize"]
+            self._file.seek(index_offset)
+            index = self._file.read(blocks * INDEX_ENTRY.size)
+            self._index = [INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size) for i in range(blocks)]
+            if self._index:
+                # steps at the end = steps before the last block + its symbols
+                offset, steps = self._index[-1]
+                self._file.seek(offset)
+                self._steps = steps + self._count_steps(self._file.read(index_offset - offset))
+            self._file.seek(index_offset)
+            self._file.truncate()
+        else:
+            if block_size <= 0:
+                raise ValueError("Block size must be positive")
+            self.block_size = block_size
+            self._file = open(path, "wb")
+            self._file.write(CONTAINER_HEADER.pack(
+                CONTAINER_MAGIC, CONTAINER_VERSION, block_size, name.encode("ascii"), machine.num_rotors
+            ))
+            self._file.write(_positions_struct(machine.num_rotors).pack(*_start_positions(machine)))
+        machine.reset_rotors()
+        machine.advance(self._steps)
+
+    def __enter__(self) -> "ContainerWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _count_steps(self, data: bytes) -> int:
+        # cipher and plain text have the same bytes outside the alphabet
+        return len(data.translate(None, self._passthrough)) if self._passthrough else len(data)
+
+    def write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            filled = self.length % self.block_size
+            if filled == 0:
+                self._index.append((self._file.tell(), self._steps))
+            piece = bytes(view[:self.block_size - filled])
+            view = view[len(piece):]
+            self._file.write(self.machine.encrypt_chunk(piece, self._byte_table))
+            self._steps += self._count_steps(piece)
+            self.length += len(piece)
+
+    def close(self) -> None:
+        """Write the block index and trailer; the container is unreadable until then"""
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+        self._file.write(CONTAINER_TRAILER.pack(index_offset, len(self._index), self.length, CONTAINER_MAGIC))
+        self._file.close()
+        self.machine.reset_rotors()
+
+
+class ContainerReader:
+    """Memory-mapped container that decrypts byte ranges on demand"""
+
+    def __init__(self, path: str | Path, machine: EnigmaMachine) -> None:
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty") from None
+        try:
+            self.header, self._index_offset, self.blocks, self.length = _read_layout(self._map)
+            if self.header["alphabet"] != alphabet_name(machine.alphabet):
+                raise ValueError(f"Container uses the '{self.header['alphabet']}' alphabet")
+            if self.header["numRotors"] != machine.num_rotors:
+                raise ValueError(f"Container was written with {self.header['numRotors']} rotors")
+            if self.header["positions"] != _start_positions(machine):
+                raise ValueError(f"Container was written from start positions {self.header['positions']}")
+        except ValueError:
+            self.close()
+            raise
+        self.machine = machine
+        self.block_size = self.header["blockSize"]
+        self._byte_table = byte_table(machine.alphabet)
+
+    def __enter__(self) -> "ContainerReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _entry(self, block: int) -> tuple[int, int]:
+        return INDEX_ENTRY.unpack_from(self._map, self._index_offset + block * INDEX_ENTRY.size)
+
+    def read(self, start: int = 0, stop: int | None = None) -> bytes:
+        """Decrypt plain text bytes [start, stop), touching only the blocks that hold them"""
+        start, stop, _ = slice(start, stop).indices(self.length)
+        if start >= stop:
+            return b""
+        first = start // self.block_size
+        offset, steps = self._entry(first)
+        end = offset + (stop - first * self.block_size)
+        self.machine.reset_rotors()
+        self.machine.advance(steps)
+        plain = self.machine.encrypt_chunk(self._map[offset:end], self._byte_table)
+        self.machine.reset_rotors()
+        return plain[start - first * self.block_size:]
+
+    def iter_blocks(self):
+        """Decrypt the whole container one block at a time"""
+        for block in range(self.blocks):
+            start = block * self.block_size
+            yield self.read(start, start + self.block_size)
+
+
+def open_container(path: str | Path, seed: int) -> ContainerReader:
+    """Open a container using the alphabet, rotor count and start positions in its header and the given key"""
+    with open(path, "rb") as container:
+        head = container.read(CONTAINER_HEADER.size)
+        if len(head) == CONTAINER_HEADER.size:
+            head += container.read(_positions_struct(CONTAINER_HEADER.unpack(head)[4]).size)
+    try:
+        header = _read_header(head)
+    except ValueError:
+        raise ValueError(f"{path} is not a container") from None
+    machine = EnigmaMachine(
+        num_rotors=header["numRotors"], alphabet=get_alphabet(header["alphabet"]), rng=random.Random(seed)
+    )
+    for rotor, position in zip(machine.rotors, header["positions"]):
+        rotor.set_initial_position(position)
+    return ContainerReader(path, machine)
@@ -0,0 +1,320 @@
+"""
+Catalog of Rejewski characteristics for every rotor start position.
+
+With the rotors at a start position, typing six letters applies the
+permutations E1..E6. The characteristic of that start position is the
+cycle structure of the products E1E4, E2E5 and E3E6. The catalog stores it
+for every start position of one machine configuration in a single file that
+can be memory-mapped and queried either by position or by characteristic.
+
+File layout (native byte order, recorded in the metadata):
+    header      CATALOG_HEADER (magic, version, metadata length)
+    metadata    JSON: configuration and the list of distinct characteristics
+    ids         uint32 per start position: index into the characteristic list
+    offsets     uint64 per characteristic + 1: slices of the positions array
+    positions   uint32 start positions grouped by characteristic
+Start positions are stored as counters, rotor 0 being the least significant
+digit, matching how the rotors step.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import random
+import shutil
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from alphabet import get_alphabet
+from enigmamachine import EnigmaMachine
+
+CATALOG_MAGIC = b"ENIGCYC1"
+CATALOG_VERSION = 1
+CATALOG_HEADER = struct.Struct("<8sII")
+DEFAULT_CHUNK_SIZE = 26 ** 3
+INDICATOR_LENGTH = 3
+
+
+def cycle_structure(permutation: list[int]) -> tuple[int, ...]:
+    """Cycle lengths of a permutation, longest first"""
+    seen = [False] * len(permutation)
+    lengths = []
+    for start in range(len(permutation)):
+        if seen[start]:
+            continue
+        length = 0
+        index = start
+        while not seen[index]:
+            seen[index] = True
+            index = permutation[index]
+            length += 1
+        lengths.append(length)
+    return tuple(sorted(lengths, reverse=True))
+
+
+def counter_to_positions(counter: int, size: int, num_rotors: int) -> list[int]:
+    positions = []
+    for _ in range(num_rotors):
+        counter, position = divmod(counter, size)
+        positions.append(position)
+    return positions
+
+
+def positions_to_counter(positions: list[int], size: int) -> int:
+    counter = 0
+    for position in reversed(positions):
+        counter = counter * size + position % size
+    return counter
+
+
+def _build_machine(seed: int, num_rotors: int, alphabet_name: str) -> EnigmaMachine:
+    return EnigmaMachine(num_rotors=num_rotors, alphabet=get_alphabet(alphabet_name), rng=random.Random(seed))
+
+
+def _characteristic_chunk(
+    seed: int, num_rotors: int, alphabet_name: str, start: int, stop: int
+) -> tuple[list, bytes]:
+    """
+    Characteristics for start positions [start, stop), as a local list of
+    distinct characteristics and a uint32 array of indices into it.
+    """
+    machine = _build_machine(seed, num_rotors, alphabet_name)
+    size = machine.alphabet.size
+    total = size ** machine.num_rotors
+    span = 2 * INDICATOR_LENGTH
+
+    # letters are typed after stepping, so start position c uses counters c+1 .. c+6
+    permutations = []
+    core_positions = None
+    core = None
+    for counter in range(start + 1, stop + span):
+        positions = counter_to_positions(counter % total, size, machine.num_rotors)
+        if positions[1:] != core_positions:
+            core_positions = positions[1:]
+            core = machine.core_table(core_positions)
+        permutations.append(machine.permutation(positions, core))
+
+    local_ids: dict[tuple, int] = {}
+    ids = array("I")
+    for offset in range(stop - start):
+        window = permutations[offset:offset + span]
+        characteristic = tuple(
+            cycle_structure([second[first[index]] for index in range(size)])
+            for first, second in zip(window[:INDICATOR_LENGTH], window[INDICATOR_LENGTH:])
+        )
+        ids.append(local_ids.setdefault(characteristic, len(local_ids)))
+    return [list(map(list, characteristic)) for characteristic in local_ids], ids.tobytes()
+
+
+def _write_part(path: Path, characteristics: list, ids: bytes) -> None:
+    header = json.dumps(characteristics).encode("utf-8")
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "wb") as part:
+        part.write(struct.pack("<I", len(header)))
+        part.write(header)
+        part.write(ids)
+    os.replace(temp_path, path)
+
+
+def _read_part(path: Path) -> tuple[list, array]:
+    data = path.read_bytes()
+    (header_length,) = struct.unpack_from("<I", data)
+    characteristics = json.loads(data[4:4 + header_length])
+    ids = array("I")
+    ids.frombytes(data[4 + header_length:])
+    return characteristics, ids
+
+
+def _read_parts_config(parts_dir: Path) -> dict | None:
+    try:
+        return json.loads((parts_dir / "config.json").read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _metadata(seed: int, num_rotors: int, alphabet_name: str) -> dict:
+    machine = _build_machine(seed, num_rotors, alphabet_name)
+    return {
+        "seed": seed,
+        "numRotors": machine.num_rotors,
+        "alphabet": alphabet_name,
+        "alphabetSize": machine.alphabet.size,
+        "positions": machine.alphabet.size ** machine.num_rotors,
+        "byteorder": sys.byteorder,
+    }
+
+
+def build_catalog(
+    path: str,
+    seed: int,
+    num_rotors: int = 3,
+    alphabet_name: str = "uppercase",
+    workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Path:
+    """
+    Build the catalog file at path unless one for this configuration exists.
+    Chunks are computed on a process pool and saved to path.parts as they
+    finish, so an interrupted build resumes where it stopped. Parts left by a
+    build with a different configuration or chunk size are discarded.
+    """
+    catalog_path = Path(path)
+    metadata = _metadata(seed, num_rotors, alphabet_name)
+    if catalog_path.exists():
+        with CycleCatalog(catalog_path) as existing:
+            if all(existing.metadata.get(key) == value for key, value in metadata.items()):
+                return catalog_path
+
+    total = metadata["positions"]
+    if total > 2 ** 32:
+        raise ValueError("Too many rotor positions for a catalog")
+    parts_dir = catalog_path.with_name(catalog_path.name + ".parts")
+    parts_config = dict(metadata, chunkSize=chunk_size)
+    if parts_dir.exists() and _read_parts_config(parts_dir) != parts_config:
+        shutil.rmtree(parts_dir)
+    if not parts_dir.exists():
+        parts_dir.mkdir(parents=True)
+        (parts_dir / "config.json").write_text(json.dumps(parts_config))
+
+    chunks = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+    todo = [
+        (index, start, stop) for index, (start, stop) in enumerate(chunks)
+        if not (parts_dir / f"{index:06d}.part").exists()
+    ]
+    args = (seed, metadata["numRotors"], alphabet_name)
+    if workers == 1 or len(todo) <= 1:
+        for index, start, stop in todo:
+            _write_part(parts_dir / f"{index:06d}.part", *_characteristic_chunk(*args, start, stop))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_characteristic_chunk, *args, start, stop): index for index, start, stop in todo
+            }
+            for future in as_completed(futures):
+                _write_part(parts_dir / f"{futures[future]:06d}.part", *future.result())
+
+    _assemble(catalog_path, parts_dir, len(chunks), metadata)
+    shutil.rmtree(parts_dir)
+    return catalog_path
+
+
+def _assemble(catalog_path: Path, parts_dir: Path, num_parts: int, metadata: dict) -> None:
+    global_ids: dict[tuple, int] = {}
+    ids = array("I")
+    for index in range(num_parts):
+        characteristics, local_ids = _read_part(parts_dir / f"{index:06d}.part")
+        mapping = [
+            global_ids.setdefault(tuple(map(tuple, characteristic)), len(global_ids))
+            for characteristic in characteristics
+        ]
+        ids.extend(mapping[local_id] for local_id in local_ids)
+
+    # number characteristics by how many positions share them, most common first
+    counts = [0] * len(global_ids)
+    for characteristic_id in ids:
+        counts[characteristic_id] += 1
+    order = sorted(range(len(global_ids)), key=lambda old: (-counts[old], old))
+    renumber = [0] * len(order)
+    for new, old in enumerate(order):
+        renumber[old] = new
+    characteristics = list(global_ids)
+    ids = array("I", (renumber[characteristic_id] for characteristic_id in ids))
+
+    offsets = array("Q", [0])
+    for old in order:
+        offsets.append(offsets[-1] + counts[old])
+    cursor = array("Q", offsets[:-1])
+    positions = array("I", bytes(4 * len(ids)))
+    for counter, characteristic_id in enumerate(ids):
+        positions[cursor[characteristic_id]] = counter
+        cursor[characteristic_id] += 1
+
+    metadata = dict(metadata, characteristics=[list(map(list, characteristics[old])) for old in order])
+    header = json.dumps(metadata).encode("utf-8")
+    header += b" " * (-(CATALOG_HEADER.size + len(header)) % 8)
+    temp_path = catalog_path.with_suffix(".tmp")
+    with open(temp_path, "wb") as catalog:
+        catalog.write(CATALOG_HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, len(header)))
+        catalog.write(header)
+        ids.tofile(catalog)
+        if len(ids) % 2:
+            catalog.write(bytes(4))  # keep the uint64 offsets aligned
+        offsets.tofile(catalog)
+        positions.tofile(catalog)
+    os.replace(temp_path, catalog_path)
+
+
+class CycleCatalog:
+    """Read-only, memory-mapped view of a catalog file"""
+
+    def __init__(self, path: str | Path) -> None:
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = CATALOG_HEADER.unpack_from(self._map)
+        if magic != CATALOG_MAGIC or version != CATALOG_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a cycle catalog")
+        start = CATALOG_HEADER.size
+        self.metadata = json.loads(self._map[start:start + header_length])
+        if self.metadata["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError("Catalog was written with a different byte order")
+        self.characteristics = [tuple(map(tuple, item)) for item in self.metadata["characteristics"]]
+        self._index = {characteristic: index for index, characteristic in enumerate(self.characteristics)}
+
+        total = self.metadata["positions"]
+        view = memoryview(self._map)
+        offset = start + header_length
+        self._ids = view[offset:offset + 4 * total].cast("I")
+        offset += 4 * total + 4 * (total % 2)
+        count = len(self.characteristics) + 1
+        self._offsets = view[offset:offset + 8 * count].cast("Q")
+        offset += 8 * count
+        self._positions = view[offset:offset + 4 * total].cast("I")
+
+    def __enter__(self) -> "CycleCatalog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for name in ("_ids", "_offsets", "_positions"):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        self._map.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self.metadata["positions"]
+
+    def _counter(self, positions: list[int]) -> int:
+        if len(positions) != self.metadata["numRotors"]:
+            raise ValueError(f"Expected {self.metadata['numRotors']} rotor positions, got {len(positions)}")
+        return positions_to_counter(positions, self.metadata["alphabetSize"])
+
+    def characteristic_at(self, positions: list[int]) -> tuple:
+        return self.characteristics[self._ids[self._counter(positions)]]
+
+    def count(self, characteristic: tuple) -> int:
+        index = self._index.get(tuple(map(tuple, characteristic)))
+        if index is None:
+            return 0
+        return self._offsets[index + 1] - self._offsets[index]
+
+    def positions_for(self, characteristic: tuple) -> list[list[int]]:
+        """Every start position whose characteristic matches"""
+        index = self._index.get(tuple(map(tuple, characteristic)))
+        if index is None:
+            return []
+        size = self.metadata["alphabetSize"]
+        num_rotors = self.metadata["numRotors"]
+        return [
+            counter_to_positions(counter, size, num_rotors)
+            for counter in self._positions[self._offsets[index]:self._offsets[index + 1]]
+        ]
@@ -0,0 +1,268 @@
+"""
+Long-lived encryption daemon serving requests over a Unix domain socket.
+
+Every message on the socket is a frame: a 4-byte big-endian length followed
+by that many bytes. A request is two frames, a JSON header and the payload:
+
+    {"op": "encrypt", "seed": 42, "numRotors": 3, "alphabet": "uppercase", "positions": [0, 5, 2]}
+
+"decrypt" is accepted as an alias for "encrypt" (Enigma is symmetric) and
+"ping" checks the daemon is alive. Payloads are UTF-8 text for letter
+alphabets and raw bytes for the "bytes" alphabet. The reply is a JSON header
+({"ok": true} or {"ok": false, "error": "..."}) followed by the result payload.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+from alphabet import get_alphabet
+from enigmamachine import EnigmaMachine
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+DEFAULT_SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir()), "enigma.sock")
+
+
+def send_frame(sock: socket.socket, data: bytes) -> None:
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes | None:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> bytes | None:
+    """Read one frame, returning None when the peer closed the connection"""
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    if size == 0:
+        return b""
+    return _recv_exact(sock, size)
+
+
+class MachineCache:
+    """
+    Warm machines keyed by configuration, evicting the least recently used.
+    Each entry has its own lock because encrypting moves the rotors.
+    """
+
+    def __init__(self, max_machines: int = 256) -> None:
+        self.max_machines = max_machines
+        self._machines: OrderedDict[tuple, tuple[EnigmaMachine, threading.Lock]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        seed: int,
+        num_rotors: int = 3,
+        alphabet_name: str = "uppercase",
+        randomize_positions: bool = False,
+        positions: tuple[int, ...] | None = None,
+    ) -> tuple[EnigmaMachine, threading.Lock]:
+        key = (seed, num_rotors, alphabet_name, randomize_positions, positions)
+        with self._lock:
+            entry = self._machines.get(key)
+            if entry is not None:
+                self._machines.move_to_end(key)
+                return entry
+
+        machine = EnigmaMachine(
+            num_rotors=num_rotors,
+            randomize_positions=randomize_positions,
+            alphabet=get_alphabet(alphabet_name),
+            rng=random.Random(seed),
+        )
+        if positions is not None:
+            if len(positions) != machine.num_rotors:
+                raise ValueError(f"Expected {machine.num_rotors} rotor positions, got {len(positions)}")
+            for rotor, position in zip(machine.rotors, positions):
+                rotor.set_initial_position(position)
+
+        with self._lock:
+            # another thread may have built the same machine meanwhile
+            entry = self._machines.setdefault(key, (machine, threading.Lock()))
+            self._machines.move_to_end(key)
+            while len(self._machines) > self.max_machines:
+                self._machines.popitem(last=False)
+        return entry
+
+
+def handle_request(cache: MachineCache, header: dict, payload: bytes) -> bytes:
+    if not isinstance(header, dict):
+        raise ValueError("Request header must be a JSON object")
+    op = header.get("op")
+    if op == "ping":
+        return b""
+    if op not in ("encrypt", "decrypt"):
+        raise ValueError(f"Unknown op '{op}'")
+    if header.get("seed") is None:
+        raise ValueError("A seed is required")
+
+    num_rotors = int(header.get("numRotors", 3))
+    if num_rotors < 1:
+        raise ValueError("numRotors must be at least 1")
+
+    positions = header.get("positions")
+    alphabet_name = header.get("alphabet", "uppercase")
+    machine, lock = cache.get(
+        seed=int(header["seed"]),
+        num_rotors=num_rotors,
+        alphabet_name=alphabet_name,
+        randomize_positions=bool(header.get("randomizePositions", False)),
+        positions=tuple(int(position) for position in positions) if positions is not None else None,
+    )
+    with lock:
+        if alphabet_name == "bytes":
+            return machine.encrypt_bytes(payload)
+        return machine.encrypt_text(payload.decode("utf-8")).encode("utf-8")
+
+
+class EnigmaDaemonHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        # connections are persistent: serve requests until the client hangs up
+        while True:
+            try:
+                raw_header = recv_frame(self.request)
+                payload = recv_frame(self.request) if raw_header is not None else None
+            except (ValueError, OSError) as error:
+                logger.warning(f"Dropping connection: {error}")
+                return
+            if raw_header is None or payload is None:
+                return
+
+            try:
+                result = handle_request(self.server.machines, json.loads(raw_header), payload)
+                reply = {"ok": True}
+            except (ValueError, TypeError, KeyError, UnicodeDecodeError) as error:
+                result = b""
+                reply = {"ok": False, "error": str(error)}
+            except Exception as error:
+                # a bug in one request must not take the connection down with it
+                logger.exception("Request failed")
+                result = b""
+                reply = {"ok": False, "error": f"Internal error: {error}"}
+            send_frame(self.request, json.dumps(reply).encode("utf-8"))
+            send_frame(self.request, result)
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    """Remove a socket left by a daemon that is no longer running"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)  # nobody is listening
+            return
+    raise RuntimeError(f"A daemon is already running on {socket_path}")
+
+
+class EnigmaDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, max_machines: int = 256) -> None:
+        if os.path.exists(socket_path):
+            _remove_stale_socket(socket_path)
+        self.socket_path = socket_path
+        self.machines = MachineCache(max_machines)
+        super().__init__(socket_path, EnigmaDaemonHandler)
+        os.chmod(socket_path, 0o600)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class EnigmaClient:
+    """Client holding one connection to the daemon, reused across calls"""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH) -> None:
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+
+    def __enter__(self) -> "EnigmaClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def request(self, header: dict, payload: bytes = b"") -> bytes:
+        send_frame(self._sock, json.dumps(header).encode("utf-8"))
+        send_frame(self._sock, payload)
+        raw_reply = recv_frame(self._sock)
+        result = recv_frame(self._sock) if raw_reply is not None else None
+        if raw_reply is None or result is None:
+            raise ConnectionError("Daemon closed the connection")
+        reply = json.loads(raw_reply)
+        if not reply.get("ok"):
+            raise ValueError(reply.get("error", "Request failed"))
+        return result
+
+    def encrypt(
+        self,
+        message: str | bytes,
+        seed: int,
+        num_rotors: int = 3,
+        alphabet: str = "uppercase",
+        positions: list[int] | None = None,
+        randomize_positions: bool = False,
+    ) -> str | bytes:
+        header = {
+            "op": "encrypt",
+            "seed": seed,
+            "numRotors": num_rotors,
+            "alphabet": alphabet,
+            "randomizePositions": randomize_positions,
+        }
+        if positions is not None:
+            header["positions"] = list(positions)
+        if isinstance(message, str):
+            result = self.request(header, message.encode("utf-8"))
+            return result if alphabet == "bytes" else result.decode("utf-8")
+        return self.request(header, bytes(message))
+
+    # Enigma is symmetric, so decryption is the same operation
+    decrypt = encrypt
+
+    def ping(self) -> None:
+        self.request({"op": "ping"})
+
+
+def serve(socket_path: str = DEFAULT_SOCKET_PATH, max_machines: int = 256) -> None:
+    server = EnigmaDaemon(socket_path, max_machines)
+    # exit cleanly on SIGTERM too, so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Enigma daemon listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nDaemon stopped")
+    finally:
+        server.server_close()
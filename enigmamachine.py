@@ -3,6 +3,7 @@ Enigma Machine Simulation
 """
 import random
 import logging
+from alphabet import UPPERCASE, byte_table as make_byte_table
 from rotor import Rotor
 from reflector import Reflector
 from plugboard import PatchBoard
@@ -15,24 +16,40 @@ class EnigmaMachine:
     Enigma machine simulation
     """
 
-    def __init__(self, num_rotors=3, seed=None, randomize_positions=False):
-        if seed is not None:
-            random.seed(seed)
+    def __init__(self, num_rotors=3, seed=None, randomize_positions=False, alphabet=UPPERCASE, rng=None):
+        # rng lets callers generate wiring from their own random.Random instance
+        # instead of reseeding the global generator
+        if rng is None:
+            rng = random
+            if seed is not None:
+                random.seed(seed)
 
         # create the rotors
         if num_rotors > 100:
             num_rotors = 100  # cap to prevent excessive resource usage
         self.num_rotors = num_rotors
-        self.rotors = [Rotor() for _ in range(self.num_rotors)]
-        self.reflector = Reflector()
-        self.patchboard = PatchBoard()
+        self.alphabet = alphabet
+        self.rotors = [Rotor(alphabet, rng) for _ in range(self.num_rotors)]
+        self.reflector = Reflector(alphabet, rng)
+        self.patchboard = PatchBoard(alphabet, rng)
         if randomize_positions:
             for rotor in self.rotors:
-                rotor.set_initial_position(random.randint(0, 25))
+                rotor.set_initial_position(rng.randint(0, alphabet.size - 1))
         for rotor in self.rotors:
             logger.debug(f"Rotor {self.rotors.index(rotor)} mappings:")
             logger.debug(rotor.rotor_mappings)
 
+    @classmethod
+    def from_components(cls, rotors, reflector, patchboard):
+        """Assemble a machine from existing components, e.g. ones built from shared tables"""
+        machine = cls.__new__(cls)
+        machine.num_rotors = len(rotors)
+        machine.alphabet = reflector.alphabet
+        machine.rotors = list(rotors)
+        machine.reflector = reflector
+        machine.patchboard = patchboard
+        return machine
+
     def _rotate_rotors(self):
         self.rotors[0].rotate()
         for i in range(1, self.num_rotors):
@@ -41,8 +58,145 @@ class EnigmaMachine:
             else:
                 break
 
+    def advance(self, steps):
+        """
+        Move the rotors forward as if steps letters had been typed.
+        Stepping is a plain odometer, so the rotor positions are the digits of
+        a base-alphabet-size counter and can be advanced arithmetically.
+        """
+        size = self.alphabet.size
+        counter = 0
+        for rotor in reversed(self.rotors):
+            counter = counter * size + rotor.current_position
+        counter = (counter + steps) % size ** self.num_rotors
+        for rotor in self.rotors:
+            counter, rotor.current_position = divmod(counter, size)
+
+    def core_table(self, positions=None):
+        """
+        Compose every rotor after the first with the reflector into one table.
+        These rotors only move when the first rotor wraps around, so the
+        table stays valid for a full revolution of the first rotor.
+        positions optionally overrides the current positions of rotors 1..n.
+        """
+        size = self.alphabet.size
+        reflector_table = self.reflector.reflector_table
+        rotors = self.rotors[1:]
+        if positions is None:
+            positions = [rotor.current_position for rotor in rotors]
+        stages = list(zip(rotors, positions))
+        table = []
+        for index in range(size):
+            for rotor, position in stages:
+                index = rotor.forward_table[(index + position) % size]
+            index = reflector_table[index]
+            for rotor, position in reversed(stages):
+                index = (rotor.reverse_table[index] - position) % size
+            table.append(index)
+        return table
+
+    def permutation(self, positions=None, core=None):
+        """
+        Full substitution (plugboard, rotors and reflector) applied to a letter
+        typed with the rotors at positions, i.e. after they have stepped.
+        core optionally supplies the core table for positions[1:].
+        """
+        size = self.alphabet.size
+        if positions is None:
+            positions = [rotor.current_position for rotor in self.rotors]
+        if core is None:
+            core = self.core_table(positions[1:])
+        plug_forward = self.patchboard.forward_table
+        plug_reverse = self.patchboard.reverse_table
+        first = self.rotors[0]
+        position = positions[0]
+        return [
+            plug_reverse[(first.reverse_table[core[first.forward_table[(plug_forward[index] + position) % size]]]
+                          - position) % size]
+            for index in range(size)
+        ]
+
+    def _cached_core_table(self, core_cache):
+        if core_cache is None:
+            return self.core_table()
+        positions = tuple(rotor.current_position for rotor in self.rotors[1:])
+        table = core_cache.get(positions)
+        if table is None:
+            table = core_cache[positions] = self.core_table(positions)
+        return table
+
+    def encrypt_indices(self, indices, core_cache=None):
+        """
+        Encrypt a sequence of alphabet indices using the integer wiring tables.
+        Rotors are left at their advanced positions, so consecutive calls
+        continue the same stream. core_cache is an optional dict of core
+        tables keyed by rotor positions, shared by callers that run many
+        start positions through the same wiring.
+        """
+        size = self.alphabet.size
+        plug_forward = self.patchboard.forward_table
+        plug_reverse = self.patchboard.reverse_table
+        first = self.rotors[0]
+        first_forward = first.forward_table
+        first_reverse = first.reverse_table
+        position = first.current_position
+        core = self._cached_core_table(core_cache)
+        output = []
+        for index in indices:
+            position += 1
+            if position == size:
+                position = 0
+                first.current_position = 0
+                for rotor in self.rotors[1:]:
+                    if rotor.rotate() != 0:
+                        break
+                core = self._cached_core_table(core_cache)
+            index = first_forward[(plug_forward[index] + position) % size]
+            index = (first_reverse[core[index]] - position) % size
+            output.append(plug_reverse[index])
+        first.current_position = position
+        return output
+
+    def encrypt_bytes(self, data):
+        """Encrypt binary data with a 256-symbol alphabet, resetting rotors afterwards"""
+        if self.alphabet.size != 256:
+            raise ValueError("encrypt_bytes requires a 256-symbol alphabet")
+        encrypted = bytes(self.encrypt_indices(data))
+        self.reset_rotors()
+        return encrypted
+
+    def encrypt_chunk(self, chunk, byte_table=None, core_cache=None):
+        """
+        Encrypt one chunk of a byte stream read as Latin-1, leaving the rotors
+        where the chunk ended. Bytes outside the alphabet pass through without
+        stepping the rotors. Callers encrypting many chunks pass byte_table
+        (see alphabet.byte_table) so it is built once.
+        """
+        if self.alphabet.size == 256:
+            return bytes(self.encrypt_indices(chunk, core_cache))
+        if byte_table is None:
+            byte_table = make_byte_table(self.alphabet)
+        lookups = [byte_table[value] for value in chunk]
+        encrypted = iter(self.encrypt_indices((index for index in lookups if index is not None), core_cache))
+        symbols = self.alphabet.symbols
+        return "".join(
+            chr(value) if index is None else symbols[next(encrypted)] for value, index in zip(chunk, lookups)
+        ).encode("latin-1")
+
+    def container_writer(self, path, block_size=None, append=False):
+        """
+        Open a seekable container file at path for writing with this machine.
+        See container.py for the format; block_size defaults to 64 KiB.
+        """
+        from container import DEFAULT_BLOCK_SIZE, ContainerWriter
+        return ContainerWriter(path, self, block_size or DEFAULT_BLOCK_SIZE, append)
+
+    def reset_rotors(self):
+        for rotor in self.rotors:
+            rotor.reset_position()
+
     def encrypt_letter_with_trace(self, letter):
-        original_letter = letter.upper()
+        original_letter = self.alphabet.symbol(self.alphabet.index(letter))
         trace = []
 
         letter = self.patchboard.get_mapping(original_letter)
@@ -129,14 +283,34 @@ class EnigmaMachine:
         return encrypted_letter
 
     def encrypt_message(self, message):
-        encrypted_message = ""
-        for letter in message:
-            if letter == " " or not letter.isalpha():
-                encrypted_message += letter  # Comment out to drop spaces and non-alpha characters
-                continue
-            encrypted_letter = self.encrypt_letter(letter)
-            encrypted_message += encrypted_letter
-        # reset all rotors to initial position
-        for rotor in self.rotors:
-            rotor.reset_position()
+        if logger.isEnabledFor(logging.INFO):
+            # per-letter path so every step of the signal is logged
+            encrypted_message = ""
+            for letter in message:
+                if letter not in self.alphabet:
+                    encrypted_message += letter  # Comment out to drop spaces and non-alphabet characters
+                    continue
+                encrypted_letter = self.encrypt_letter(letter)
+                encrypted_message += encrypted_letter
+            # reset all rotors to initial position
+            self.reset_rotors()
+            return encrypted_message
+        return self.encrypt_text(message)
+
+    def encrypt_text(self, message, reset=True):
+        """
+        Encrypt message on the integer tables without per-letter logging.
+        Characters outside the alphabet pass through. Rotors are reset
+        afterwards unless reset is False, which lets a stream be encrypted
+        in consecutive pieces.
+        """
+        find = self.alphabet.find
+        indices = [find(letter) for letter in message]
+        encrypted = iter(self.encrypt_indices(index for index in indices if index is not None))
+        symbols = self.alphabet.symbols
+        encrypted_message = "".join(
+            letter if index is None else symbols[next(encrypted)] for letter, index in zip(message, indices)
+        )
+        if reset:
+            self.reset_rotors()
         return encrypted_message
@@ -0,0 +1,274 @@
+"""
+Plugboard recovery by hill climbing.
+
+With the rotor and reflector wiring and the start positions known, the
+letter typed at step i is encrypted as P(S_i(P(c))), where S_i is the
+scrambler (rotors and reflector) at that step and P the plugboard. The
+search starts from a random full pairing of the alphabet and keeps swapping
+partners between two pairs, (a b)(c d) -> (a c)(b d) or (a d)(b c), while
+that raises the n-gram fitness of the decryption. Climbs from many random
+starting pairings run on a process pool until the restarts or the time
+budget run out, and the best pairing found wins.
+
+A swap only changes letters whose cipher letter, or whose scrambler output,
+is one of the four swapped symbols. The climber indexes positions by both,
+so it rescores just the n-grams touching those positions instead of
+decrypting the whole message again.
+"""
+from __future__ import annotations
+
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+
+from alphabet import UPPERCASE
+from cycles import counter_to_positions, positions_to_counter
+from enigmamachine import EnigmaMachine
+from plugboard import PatchBoard
+
+
+class NgramModel:
+    """Log10 n-gram probabilities over alphabet indices, flattened into one list"""
+
+    def __init__(self, n: int, size: int, scores: list[float]) -> None:
+        self.n = n
+        self.size = size
+        self.scores = scores
+
+    @classmethod
+    def from_text(cls, text: str, alphabet=UPPERCASE, n: int = 3) -> "NgramModel":
+        """Count the n-grams of text's alphabet symbols, ignoring everything else"""
+        indices = [index for index in map(alphabet.find, text) if index is not None]
+        if len(indices) < n:
+            raise ValueError(f"Training text needs at least {n} alphabet symbols")
+        size = alphabet.size
+        counts = Counter(_code(indices, start, n, size) for start in range(len(indices) - n + 1))
+        total = sum(counts.values())
+        floor = math.log10(0.01 / total)  # unseen n-grams
+        scores = [floor] * size ** n
+        for code, count in counts.items():
+            scores[code] = math.log10(count / total)
+        return cls(n, size, scores)
+
+    def score(self, indices: list[int]) -> float:
+        scores, n, size = self.scores, self.n, self.size
+        return sum(scores[_code(indices, start, n, size)] for start in range(len(indices) - n + 1))
+
+
+def _code(indices, start: int, n: int, size: int) -> int:
+    code = 0
+    for offset in range(n):
+        code = code * size + indices[start + offset]
+    return code
+
+
+def scrambler_tables(machine: EnigmaMachine, length: int, positions: list[int] | None = None) -> list[list[int]]:
+    """
+    The rotor and reflector substitution (no plugboard) for each of length
+    letters typed from the start positions (default: the machine's own).
+    """
+    size = machine.alphabet.size
+    if positions is None:
+        positions = [rotor.initial_position for rotor in machine.rotors]
+    if len(positions) != machine.num_rotors:
+        raise ValueError(f"Expected {machine.num_rotors} rotor positions, got {len(positions)}")
+    identity = PatchBoard.from_table(list(range(size)), machine.alphabet)
+    bare = EnigmaMachine.from_components(machine.rotors, machine.reflector, identity)
+
+    total = size ** machine.num_rotors
+    counter = positions_to_counter(positions, size)
+    tables = []
+    core_positions = None
+    core = None
+    for step in range(1, length + 1):
+        # letters are typed after the rotors step
+        current = counter_to_positions((counter + step) % total, size, machine.num_rotors)
+        if current[1:] != core_positions:
+            core_positions = current[1:]
+            core = bare.core_table(core_positions)
+        tables.append(bare.permutation(current, core))
+    return tables
+
+
+def _random_pairing(size: int, rng: random.Random) -> list[int]:
+    symbols = list(range(size))
+    rng.shuffle(symbols)
+    table = [0] * size
+    for index in range(0, size, 2):
+        first, second = symbols[index], symbols[index + 1]
+        table[first] = second
+        table[second] = first
+    return table
+
+
+# search inputs, set once per worker process by _init_search
+_SEARCH: tuple = ()
+
+
+def _init_search(scramblers: list[list[int]], cipher: list[int], model: NgramModel) -> None:
+    global _SEARCH
+    _SEARCH = (scramblers, cipher, model)
+
+
+def _climb(seed: int) -> tuple[float, list[int]]:
+    """Hill climb from one random pairing to a local optimum"""
+    scramblers, cipher, model = _SEARCH
+    rng = random.Random(seed)
+    size, n, scores = model.size, model.n, model.scores
+    length = len(cipher)
+    plug = _random_pairing(size, rng)
+
+    by_cipher = [[] for _ in range(size)]
+    for position, letter in enumerate(cipher):
+        by_cipher[letter].append(position)
+    middle = [scramblers[position][plug[letter]] for position, letter in enumerate(cipher)]
+    by_middle = [set() for _ in range(size)]
+    for position, letter in enumerate(middle):
+        by_middle[letter].add(position)
+    plain = [plug[letter] for letter in middle]
+    score = model.score(plain)
+
+    improved = True
+    while improved:
+        improved = False
+        pairs = [(first, plug[first]) for first in range(size) if first < plug[first]]
+        rng.shuffle(pairs)
+        for j, (a, b) in enumerate(pairs):
+            for c, d in pairs[j + 1:]:
+                if plug[a] != b or plug[c] != d:
+                    continue  # one of the pairs changed earlier in this sweep
+                for x, y in ((c, d), (d, c)):
+                    trial = plug[:]
+                    trial[a], trial[x], trial[b], trial[y] = x, a, y, b
+
+                    new_middle = {}
+                    new_plain = {}
+                    for symbol in (a, b, c, d):
+                        for position in by_cipher[symbol]:
+                            letter = scramblers[position][trial[cipher[position]]]
+                            new_middle[position] = letter
+                            new_plain[position] = trial[letter]
+                    for symbol in (a, b, c, d):
+                        for position in by_middle[symbol]:
+                            if position not in new_middle:
+                                new_plain[position] = trial[middle[position]]
+
+                    starts = set()
+                    for position, letter in new_plain.items():
+                        if letter != plain[position]:
+                            starts.update(range(max(0, position - n + 1), min(position, length - n) + 1))
+                    delta = 0.0
+                    for start in starts:
+                        old_code = new_code = 0
+                        for offset in range(start, start + n):
+                            old_code = old_code * size + plain[offset]
+                            new_code = new_code * size + new_plain.get(offset, plain[offset])
+                        delta += scores[new_code] - scores[old_code]
+                    if delta <= 1e-9:
+                        continue
+
+                    plug = trial
+                    score += delta
+                    for position, letter in new_middle.items():
+                        by_middle[middle[position]].discard(position)
+                        by_middle[letter].add(position)
+                        middle[position] = letter
+                    for position, letter in new_plain.items():
+                        plain[position] = letter
+                    improved = True
+                    break
+    return score, plug
+
+
+@dataclass
+class PlugboardRecovery:
+    score: float
+    table: list[int]
+    plaintext: str
+    restarts: int
+    seconds: float
+
+    def pairs(self, alphabet=UPPERCASE) -> list[str]:
+        symbols = alphabet.symbols
+        return [symbols[first] + symbols[second] for first, second in enumerate(self.table) if first < second]
+
+    def patchboard(self, alphabet=UPPERCASE) -> PatchBoard:
+        return PatchBoard.from_table(list(self.table), alphabet)
+
+
+def recover_plugboard(
+    ciphertext: str,
+    machine: EnigmaMachine,
+    model: NgramModel,
+    positions: list[int] | None = None,
+    restarts: int = 200,
+    workers: int | None = None,
+    time_budget: float | None = None,
+    seed: int | None = None,
+) -> PlugboardRecovery:
+    """
+    Recover the plugboard of machine (whose own plugboard is ignored) from
+    ciphertext, given its start positions. Symbols outside the alphabet are
+    dropped. Stops after restarts climbs or time_budget seconds, whichever
+    comes first; climbs already running when time runs out are finished.
+    """
+    if restarts < 1:
+        raise ValueError("At least one restart is needed")
+    alphabet = machine.alphabet
+    if model.size != alphabet.size:
+        raise ValueError("N-gram model was trained on a different alphabet")
+    cipher = [index for index in map(alphabet.find, ciphertext) if index is not None]
+    if len(cipher) < model.n:
+        raise ValueError("Not enough ciphertext to score")
+    scramblers = scrambler_tables(machine, len(cipher), positions)
+    base_seed = random.randrange(2 ** 32) if seed is None else seed
+    start = time.perf_counter()
+    deadline = start + time_budget if time_budget is not None else math.inf
+
+    best: tuple[float, list[int]] | None = None
+    done = 0
+    if workers == 1:
+        _init_search(scramblers, cipher, model)
+        while done < restarts and time.perf_counter() < deadline:
+            score, table = _climb(base_seed + done)
+            done += 1
+            if best is None or score > best[0]:
+                best = score, table
+    else:
+        max_workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers, initializer=_init_search, initargs=(scramblers, cipher, model)) as pool:
+            pending = set()
+            submitted = 0
+            while True:
+                # keep every worker busy, with one climb queued behind it
+                while submitted < restarts and len(pending) < 2 * max_workers and time.perf_counter() < deadline:
+                    pending.add(pool.submit(_climb, base_seed + submitted))
+                    submitted += 1
+                if not pending:
+                    break
+                timeout = None if deadline == math.inf else max(0.0, deadline - time.perf_counter())
+                finished, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not finished:
+                    # out of time: drop queued climbs, keep the ones already running
+                    for future in pending:
+                        future.cancel()
+                    finished, pending = wait(pending)[0], set()
+                for future in finished:
+                    if future.cancelled():
+                        continue
+                    score, table = future.result()
+                    done += 1
+                    if best is None or score > best[0]:
+                        best = score, table
+
+    if best is None:
+        raise ValueError("Time budget ran out before any climb finished")
+    score, table = best
+    plaintext = "".join(
+        alphabet.symbols[table[scramblers[position][table[letter]]]] for position, letter in enumerate(cipher)
+    )
+    return PlugboardRecovery(score, table, plaintext, done, time.perf_counter() - start)
@@ -0,0 +1,282 @@
+"""
+Load generator for the web API.
+
+Creates sessions through /api/session, then replays a weighted mix of
+/api/keypress, /api/encrypt, /api/state and /api/reset from a pool of client
+threads, either as fast as they can go or at a fixed request rate. The
+report gives throughput, latency percentiles and error rates per route and
+the server's memory growth, as JSON so runs of different builds can be
+compared.
+
+With a fixed rate, each request has a scheduled start time and its latency
+is measured from that time, so a slow server is not hidden by the client
+backing off (coordinated omission).
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.client import HTTPConnection, HTTPException
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_MIX = {"keypress": 70, "encrypt": 10, "state": 15, "reset": 5}
+ROUTES = {name: f"/api/{name}" for name in DEFAULT_MIX}
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    """Parse "keypress=70,encrypt=10" into route weights"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route '{name}', expected one of {', '.join(ROUTES)}")
+        mix[name] = float(weight) if weight else 1.0
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("At least one route needs a positive weight")
+    return mix
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def resident_memory(pid: int | None = None) -> int | None:
+    """Resident set size in bytes from /proc, or the peak RSS of this process elsewhere"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None or pid == os.getpid():
+        try:
+            import resource  # Unix only, and only needed without /proc
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+@dataclass
+class RouteStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def report(self, seconds: float) -> dict:
+        latencies = sorted(self.latencies)
+        count = len(latencies) + self.errors
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "errorRate": self.errors / count if count else 0.0,
+            "throughput": count / seconds if seconds else 0.0,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": (latencies[-1] if latencies else 0.0) * 1000,
+            "mean": (sum(latencies) / len(latencies) if latencies else 0.0) * 1000,
+        }
+
+
+def _quiet_handler():
+    from web_server import EnigmaRequestHandler
+
+    class QuietRequestHandler(EnigmaRequestHandler):
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return QuietRequestHandler
+
+
+class _Client:
+    """One keep-alive connection, reopened when the server closes it"""
+
+    def __init__(self, host: str, port: int, timeout: float) -> None:
+        self.connection = HTTPConnection(host, port, timeout=timeout)
+
+    def post(self, path: str, payload: dict) -> tuple[int, dict]:
+        session_id = payload.get("sessionId")
+        headers = {"Content-Type": "application/json"}
+        if session_id:
+            headers["X-Enigma-Session"] = session_id
+        try:
+            self.connection.request("POST", path, json.dumps(payload), headers)
+            response = self.connection.getresponse()
+            body = response.read()
+        except (OSError, HTTPException):
+            self.connection.close()
+            raise
+        if response.will_close:
+            self.connection.close()
+        return response.status, json.loads(body) if body else {}
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _payload(route: str, session_id: str, rng: random.Random, message_length: int) -> dict:
+    if route == "keypress":
+        return {"sessionId": session_id, "letter": rng.choice(LETTERS)}
+    if route == "encrypt":
+        return {"sessionId": session_id, "message": "".join(rng.choices(LETTERS, k=message_length))}
+    return {"sessionId": session_id}
+
+
+def run_load(
+    url: str | None = None,
+    sessions: int = 10,
+    concurrency: int = 8,
+    duration: float = 10.0,
+    rate: float | None = None,
+    mix: dict[str, float] | None = None,
+    message_length: int = 200,
+    num_rotors: int = 3,
+    seed: int | None = None,
+    server_pid: int | None = None,
+    timeout: float = 10.0,
+) -> dict:
+    """
+    Run one load test and return the report. Without a url the server runs
+    in this process on a free port, and its memory growth includes the
+    client threads.
+    """
+    mix = mix or DEFAULT_MIX
+    routes = [route for route, weight in mix.items() if weight > 0]
+    weights = [mix[route] for route in routes]
+
+    server = None
+    if url is None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _quiet_handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = "127.0.0.1", server.server_address[1]
+        target = f"http://{host}:{port}"
+        server_pid = os.getpid()
+    else:
+        parsed = urlparse(url if "://" in url else f"http://{url}")
+        host, port = parsed.hostname or "127.0.0.1", parsed.port or 80
+        target = f"http://{host}:{port}"
+
+    try:
+        memory_before = resident_memory(server_pid) if server_pid else None
+        setup = _Client(host, port, timeout)
+        session_ids = []
+        for index in range(sessions):
+            session_seed = None if seed is None else seed + index
+            status, body = setup.post("/api/session", {"numRotors": num_rotors, "seed": session_seed})
+            if status != 200:
+                raise RuntimeError(f"Creating a session failed with HTTP {status}: {body.get('error', '')}")
+            session_ids.append(body["sessionId"])
+        setup.close()
+
+        stats = {route: RouteStats() for route in routes}
+        stats_lock = threading.Lock()
+        schedule_lock = threading.Lock()
+        next_slot = [0]
+        start = time.perf_counter()
+        deadline = start + duration
+
+        def worker(worker_id: int) -> None:
+            rng = random.Random(None if seed is None else seed * 1000 + worker_id)
+            client = _Client(host, port, timeout)
+            local = {route: RouteStats() for route in routes}
+            try:
+                while True:
+                    if rate:
+                        with schedule_lock:
+                            scheduled = start + next_slot[0] / rate
+                            next_slot[0] += 1
+                        if scheduled >= deadline:
+                            break
+                        delay = scheduled - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    else:
+                        scheduled = time.perf_counter()
+                        if scheduled >= deadline:
+                            break
+
+                    route = rng.choices(routes, weights)[0]
+                    payload = _payload(route, rng.choice(session_ids), rng, message_length)
+                    try:
+                        status, _ = client.post(ROUTES[route], payload)
+                        ok = status == 200
+                    except (OSError, HTTPException, ValueError):
+                        ok = False
+                    if ok:
+                        local[route].latencies.append(time.perf_counter() - scheduled)
+                    else:
+                        local[route].errors += 1
+            finally:
+                client.close()
+                with stats_lock:
+                    for route, route_stats in local.items():
+                        stats[route].latencies.extend(route_stats.latencies)
+                        stats[route].errors += route_stats.errors
+
+        threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+        memory_after = resident_memory(server_pid) if server_pid else None
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    total = RouteStats()
+    for route_stats in stats.values():
+        total.latencies.extend(route_stats.latencies)
+        total.errors += route_stats.errors
+    memory = None
+    if memory_before is not None and memory_after is not None:
+        memory = {"before": memory_before, "after": memory_after, "growth": memory_after - memory_before}
+    return {
+        "config": {
+            "target": target,
+            "inProcess": server is not None,
+            "sessions": sessions,
+            "concurrency": concurrency,
+            "duration": duration,
+            "rate": rate,
+            "mix": {route: mix[route] for route in routes},
+            "messageLength": message_length,
+            "numRotors": num_rotors,
+        },
+        "seconds": seconds,
+        "total": total.report(seconds),
+        "routes": {route: route_stats.report(seconds) for route, route_stats in stats.items()},
+        "memory": memory,
+    }
+
+
+def format_report(report: dict) -> str:
+    """Human-readable table of a report"""
+    lines = [f"{'route':<10} {'requests':>9} {'req/s':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+    for name, row in list(report["routes"].items()) + [("total", report["total"])]:
+        lines.append(
+            f"{name:<10} {row['requests']:>9} {row['throughput']:>9.1f} {row['errors']:>7} "
+            f"{row['p50']:>8.2f} {row['p95']:>8.2f} {row['p99']:>8.2f}"
+        )
+    memory = report["memory"]
+    if memory is not None:
+        lines.append(f"server memory: {memory['before'] / 1e6:.1f} MB -> {memory['after'] / 1e6:.1f} MB "
+                     f"({memory['growth'] / 1e6:+.1f} MB)")
+    return "\n".join(lines)
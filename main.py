@@ -2,7 +2,12 @@
 Main entry point for Enigma Machine simulation
 """
 import argparse
+import json
 import logging
+import os
+import sys
+import time
+from alphabet import ALPHABETS
 from enigmamachine import EnigmaMachine
 
 
@@ -19,26 +24,306 @@ def get_sample_text(file, length):
     return text[:length]
 
 
-# Configure logging to both console and file
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('enigma.log', mode='w'),
-        logging.StreamHandler()
-    ]
-)
+def configure_logging():
+    """
+    Configure logging to both console and file
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('enigma.log', mode='w'),
+            logging.StreamHandler()
+        ]
+    )
+
+
 logger = logging.getLogger(__name__)
 
 
+def run_batch(args):
+    """
+    Encrypt a directory or glob of files into an output tree
+    """
+    from bulk import encrypt_tree, summarize
+
+    start = time.perf_counter()
+    results = encrypt_tree(
+        args.input,
+        args.output,
+        seed=args.seed,
+        num_rotors=args.rotors,
+        alphabet_name=args.alphabet,
+        workers=args.workers,
+        force=args.force,
+        share_tables=args.share_tables,
+    )
+    summary = summarize(results, time.perf_counter() - start)
+    logger.info(
+        f"Encrypted {summary['files']} files ({summary['skipped']} unchanged, skipped): "
+        f"{summary['bytes']} bytes in {summary['seconds']:.3f}s ({summary['throughput'] / 1e6:.2f} MB/s)"
+    )
+
+
+def run_client(args):
+    """
+    Send one message to a running daemon and print the result
+    """
+    from daemon import EnigmaClient
+
+    message = args.message if args.message is not None else sys.stdin.read()
+    with EnigmaClient(args.socket) as client:
+        print(client.encrypt(message, seed=args.seed, num_rotors=args.rotors, alphabet=args.alphabet), end="")
+    if args.message is not None:
+        print()
+
+
+def run_catalog(args):
+    """
+    Build (or reuse) a cycle-structure catalog and optionally query it
+    """
+    from cycles import CycleCatalog, build_catalog
+
+    start = time.perf_counter()
+    path = build_catalog(args.path, seed=args.seed, num_rotors=args.rotors, workers=args.workers)
+    with CycleCatalog(path) as catalog:
+        logger.info(
+            f"Catalog {path}: {len(catalog)} start positions, {len(catalog.characteristics)} distinct "
+            f"characteristics ({time.perf_counter() - start:.2f}s)"
+        )
+        if args.positions:
+            positions = [int(position) for position in args.positions.split(",")]
+            characteristic = catalog.characteristic_at(positions)
+            logger.info(f"Positions {positions}: characteristic {characteristic}")
+            logger.info(f"{catalog.count(characteristic)} start positions share this characteristic")
+
+
+def run_pack(args):
+    """
+    Encrypt a file (or stdin) into a seekable container
+    """
+    import random
+    from container import DEFAULT_BLOCK_SIZE
+
+    enigma_machine = EnigmaMachine(args.rotors, alphabet=ALPHABETS[args.alphabet], rng=random.Random(args.seed))
+    start = time.perf_counter()
+    source = open(args.input, "rb") if args.input != "-" else sys.stdin.buffer
+    try:
+        with enigma_machine.container_writer(args.output, args.block_size or DEFAULT_BLOCK_SIZE, args.append) as writer:
+            while chunk := source.read(1 << 20):
+                writer.write(chunk)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    logger.info(f"Packed {writer.length} bytes into {args.output} ({time.perf_counter() - start:.3f}s)")
+
+
+def run_unpack(args):
+    """
+    Decrypt a whole container into a file
+    """
+    from container import open_container
+
+    start = time.perf_counter()
+    with open_container(args.input, args.seed) as reader, open(args.output, "wb") as output:
+        for block in reader.iter_blocks():
+            output.write(block)
+    logger.info(f"Unpacked {len(reader)} bytes into {args.output} ({time.perf_counter() - start:.3f}s)")
+
+
+def run_extract(args):
+    """
+    Decrypt one byte range of a container to stdout or a file
+    """
+    from container import open_container
+
+    with open_container(args.input, args.seed) as reader:
+        stop = None if args.length is None else args.start + args.length
+        data = reader.read(args.start, stop)
+    if args.output:
+        with open(args.output, "wb") as output:
+            output.write(data)
+    else:
+        sys.stdout.buffer.write(data)
+
+
+def run_plugboard(args):
+    """
+    Recover a plugboard from ciphertext with known rotor wiring and positions
+    """
+    import random
+    from hillclimb import NgramModel, recover_plugboard
+
+    if args.input == "-":
+        ciphertext = sys.stdin.read()
+    else:
+        with open(args.input) as source:
+            ciphertext = source.read()
+    enigma_machine = EnigmaMachine(args.rotors, rng=random.Random(args.seed))
+    with open(args.corpus) as corpus:
+        model = NgramModel.from_text(corpus.read(), n=args.ngram)
+    positions = [int(position) for position in args.positions.split(",")] if args.positions else None
+    result = recover_plugboard(
+        ciphertext,
+        enigma_machine,
+        model,
+        positions=positions,
+        restarts=args.restarts,
+        workers=args.workers,
+        time_budget=args.time_budget,
+        seed=args.search_seed,
+    )
+    logger.info(f"Best of {result.restarts} climbs in {result.seconds:.1f}s (score {result.score:.1f})")
+    logger.info(f"Plugboard pairs: {' '.join(result.pairs())}")
+    logger.info(f"Decrypted: {result.plaintext}")
+
+
+def run_loadtest(args):
+    """
+    Drive the web API with a mix of requests and report latency per route
+    """
+    from loadgen import format_report, parse_mix, run_load
+
+    report = run_load(
+        url=args.url,
+        sessions=args.sessions,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        rate=args.rate,
+        mix=parse_mix(args.mix) if args.mix else None,
+        message_length=args.message_length,
+        num_rotors=args.rotors,
+        seed=args.seed,
+        server_pid=args.server_pid,
+    )
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
+
+
 def main():
     """
     Main entry point
     """
     parser = argparse.ArgumentParser(description="Run Enigma Machine simulation")
     parser.add_argument("--seed", type=int, default=None, help="Optional seed for deterministic rotor wiring")
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch_parser = subparsers.add_parser("batch", help="Encrypt a directory or glob of files")
+    batch_parser.add_argument("input", help="Input directory, file or glob pattern (quote globs)")
+    batch_parser.add_argument("output", help="Output directory for the encrypted tree")
+    batch_parser.add_argument("--seed", type=int, required=True, help="Seed for the rotor wiring (the key)")
+    batch_parser.add_argument("--rotors", type=int, default=3, help="Number of rotors")
+    batch_parser.add_argument("--alphabet", choices=sorted(ALPHABETS), default="bytes", help="Symbols to encrypt")
+    batch_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    batch_parser.add_argument("--force", action="store_true", help="Re-encrypt files even if unchanged")
+    batch_parser.add_argument("--share-tables", action="store_true",
+                              help="Share compiled tables (and core tables, for large trees) with all workers")
+
+    serve_parser = subparsers.add_parser("serve", help="Run the encryption daemon on a Unix socket")
+    serve_parser.add_argument("--socket", default=None, help="Socket path (default: $XDG_RUNTIME_DIR/enigma.sock)")
+    serve_parser.add_argument("--max-machines", type=int, default=256, help="Warm machines to keep")
+
+    client_parser = subparsers.add_parser("client", help="Encrypt a message using a running daemon")
+    client_parser.add_argument("message", nargs="?", default=None, help="Message to encrypt (default: stdin)")
+    client_parser.add_argument("--socket", default=None, help="Daemon socket path")
+    client_parser.add_argument("--seed", type=int, required=True, help="Seed for the rotor wiring (the key)")
+    client_parser.add_argument("--rotors", type=int, default=3, help="Number of rotors")
+    client_parser.add_argument("--alphabet", choices=sorted(set(ALPHABETS) - {"bytes"}), default="uppercase",
+                               help="Symbols to encrypt")
+
+    catalog_parser = subparsers.add_parser("catalog", help="Build or query a cycle-structure catalog")
+    catalog_parser.add_argument("path", help="Catalog file (reused if it matches the configuration)")
+    catalog_parser.add_argument("--seed", type=int, required=True, help="Seed for the rotor wiring")
+    catalog_parser.add_argument("--rotors", type=int, default=3, help="Number of rotors")
+    catalog_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    catalog_parser.add_argument("--positions", default=None, help="Comma-separated start positions to look up")
+
+    pack_parser = subparsers.add_parser("pack", help="Encrypt a file into a seekable container")
+    pack_parser.add_argument("input", help="File to encrypt ('-' for stdin)")
+    pack_parser.add_argument("output", help="Container file to write")
+    pack_parser.add_argument("--seed", type=int, required=True, help="Seed for the rotor wiring (the key)")
+    pack_parser.add_argument("--rotors", type=int, default=3, help="Number of rotors")
+    pack_parser.add_argument("--alphabet", choices=sorted(ALPHABETS), default="bytes", help="Symbols to encrypt")
+    pack_parser.add_argument("--block-size", type=int, default=None, help="Plain text bytes per block (default 64 KiB)")
+    pack_parser.add_argument("--append", action="store_true", help="Append to an existing container")
+
+    unpack_parser = subparsers.add_parser("unpack", help="Decrypt a whole container")
+    unpack_parser.add_argument("input", help="Container file")
+    unpack_parser.add_argument("output", help="File to write the plain text to")
+    unpack_parser.add_argument("--seed", type=int, required=True, help="Seed for the rotor wiring (the key)")
+
+    extract_parser = subparsers.add_parser("extract", help="Decrypt a byte range of a container")
+    extract_parser.add_argument("input", help="Container file")
+    extract_parser.add_argument("--seed", type=int, required=True, help="Seed for the rotor wiring (the key)")
+    extract_parser.add_argument("--start", type=int, default=0, help="First plain text byte")
+    extract_parser.add_argument("--length", type=int, default=None, help="Bytes to extract (default: to the end)")
+    extract_parser.add_argument("--output", "-o", default=None, help="Write here instead of stdout")
+
+    plug_parser = subparsers.add_parser("plugboard", help="Recover the plugboard by hill climbing")
+    plug_parser.add_argument("input", help="File holding the ciphertext ('-' for stdin)")
+    plug_parser.add_argument("--seed", type=int, required=True, help="Seed of the known rotor and reflector wiring")
+    plug_parser.add_argument("--rotors", type=int, default=3, help="Number of rotors")
+    plug_parser.add_argument("--positions", default=None, help="Comma-separated rotor start positions (default 0s)")
+    plug_parser.add_argument("--corpus", default="long_text.txt", help="Text to train the n-gram model on")
+    plug_parser.add_argument("--ngram", type=int, default=3, help="N-gram length for scoring")
+    plug_parser.add_argument("--restarts", type=int, default=200, help="Random restarts to try")
+    plug_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    plug_parser.add_argument("--time-budget", type=float, default=None,
+                             help="Stop starting climbs after this many seconds")
+    plug_parser.add_argument("--search-seed", type=int, default=None, help="Seed for the random restarts")
+
+    load_parser = subparsers.add_parser("loadtest", help="Load test the web API and report latency percentiles")
+    load_parser.add_argument("--url", default=None, help="Server to test (default: start one in this process)")
+    load_parser.add_argument("--sessions", type=int, default=10, help="Sessions to create")
+    load_parser.add_argument("--concurrency", type=int, default=8, help="Client threads")
+    load_parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    load_parser.add_argument("--rate", type=float, default=None, help="Target requests per second (default: max)")
+    load_parser.add_argument("--mix", default=None, help="Route weights, e.g. keypress=70,encrypt=10,state=15,reset=5")
+    load_parser.add_argument("--message-length", type=int, default=200, help="Letters per /api/encrypt message")
+    load_parser.add_argument("--rotors", type=int, default=3, help="Rotors per session")
+    load_parser.add_argument("--seed", type=int, default=None, help="Seed for sessions and the request mix")
+    load_parser.add_argument("--server-pid", type=int, default=None, help="PID of a --url server, to track memory")
+    load_parser.add_argument("--json", default=None, help="Write the full report to this JSON file")
     args = parser.parse_args()
 
+    if args.command == "loadtest":
+        # no INFO logging: the in-process server would log every request
+        run_loadtest(args)
+        return
+    if args.command == "extract":
+        # stdout carries the data, so no logging
+        run_extract(args)
+        return
+    if args.command == "client":
+        # keep the client thin: no log file, no machine construction
+        from daemon import DEFAULT_SOCKET_PATH
+        args.socket = args.socket or DEFAULT_SOCKET_PATH
+        run_client(args)
+        return
+
+    configure_logging()
+    if args.command == "batch":
+        run_batch(args)
+        return
+    if args.command == "catalog":
+        run_catalog(args)
+        return
+    if args.command == "plugboard":
+        run_plugboard(args)
+        return
+    if args.command == "pack":
+        run_pack(args)
+        return
+    if args.command == "unpack":
+        run_unpack(args)
+        return
+    if args.command == "serve":
+        from daemon import DEFAULT_SOCKET_PATH, serve
+        serve(args.socket or DEFAULT_SOCKET_PATH, args.max_machines)
+        return
+
     enigma_machine = EnigmaMachine(3, seed=args.seed)
 
     logger.info("Encrypting message")
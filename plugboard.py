@@ -1,42 +1,63 @@
 import random
 import logging
 
+from alphabet import UPPERCASE
+
 logger = logging.getLogger(__name__)
 
 
 class PatchBoard:
     """
     Enigma patch simulation.
-    Patchboard wiring is represented as 13 symmetric letter pairs.
+    Patchboard wiring is represented as symmetric symbol pairs covering the alphabet.
     """
 
-    def __init__(self):
+    def __init__(self, alphabet=UPPERCASE, rng=random):
+        self.alphabet = alphabet
+        self.forward_table = []
+        self.reverse_table = []
         self.rotor_mappings = {}
-        self._randomize_rotor()
+        self._randomize_rotor(rng)
         logger.debug("Patchboard mappings:")
         logger.debug(self.rotor_mappings)
 
-    # setup random symmetric patchboard pairs
-    def _randomize_rotor(self):
-        available_letters = [chr(i) for i in range(ord('A'), ord('Z') + 1)]
-        random.shuffle(available_letters)
+    @classmethod
+    def from_table(cls, forward_table, alphabet=UPPERCASE):
+        """Build a patchboard around an existing (symmetric) wiring table"""
+        patchboard = cls.__new__(cls)
+        patchboard.alphabet = alphabet
+        patchboard.forward_table = forward_table
+        patchboard.reverse_table = forward_table
+        symbols = alphabet.symbols
+        patchboard.rotor_mappings = {symbols[i]: symbols[mapped] for i, mapped in enumerate(forward_table)}
+        return patchboard
 
-        for i in range(0, 26, 2):
-            letter1 = available_letters[i]
-            letter2 = available_letters[i + 1]
-            self.rotor_mappings[letter1] = letter2
-            self.rotor_mappings[letter2] = letter1
+    # setup random symmetric patchboard pairs
+    def _randomize_rotor(self, rng):
+        size = self.alphabet.size
+        available_indices = list(range(size))
+        rng.shuffle(available_indices)
+
+        self.forward_table = [0] * size
+        for i in range(0, size, 2):
+            index1 = available_indices[i]
+            index2 = available_indices[i + 1]
+            self.forward_table[index1] = index2
+            self.forward_table[index2] = index1
+        # pairs are symmetric, so the reverse wiring is the same table
+        self.reverse_table = self.forward_table
+
+        symbols = self.alphabet.symbols
+        self.rotor_mappings = {
+            symbols[index1]: symbols[available_indices[i ^ 1]] for i, index1 in enumerate(available_indices)
+        }
 
     def get_mapping(self, letter):
-        letter = letter.upper()
-        mapped_letter = self.rotor_mappings[letter]
+        mapped_letter = self.alphabet.symbol(self.forward_table[self.alphabet.index(letter)])
         logger.debug(f"Patchboard: Letter {letter} mapped to {mapped_letter}")
         return mapped_letter
 
     def get_reverse_mapping(self, letter):
-        letter = letter.upper()
-        for key, value in self.rotor_mappings.items():
-            if value == letter:
-                logger.debug(f"Patchboard: Letter {letter} reverse mapped to {key}")
-                return key
-        raise ValueError("Letter must be between A-Z")
+        key = self.alphabet.symbol(self.reverse_table[self.alphabet.index(letter)])
+        logger.debug(f"Patchboard: Letter {letter} reverse mapped to {key}")
+        return key
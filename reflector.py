@@ -4,38 +4,55 @@ Enigma reflector simulation
 import random
 import logging
 
+from alphabet import UPPERCASE
+
 logger = logging.getLogger(__name__)
 
 
 class Reflector:
     """
     Enigma reflector simulation
-    Reflector has 13 random pairs where each letter maps symmetrically
+    Reflector pairs every symbol with another, so each maps symmetrically
     If A->C, then C->A
     """
 
-    def __init__(self):
+    def __init__(self, alphabet=UPPERCASE, rng=random):
+        self.alphabet = alphabet
+        self.reflector_table = []
         self.reflector_mappings = {}
-        self._randomize_reflector()
-
-    def _randomize_reflector(self):
-        # Get all 26 letters
-        available_letters = [chr(i) for i in range(ord('A'), ord('Z') + 1)]
-        random.shuffle(available_letters)
-
-        # Create 13 pairs
-        for i in range(0, 26, 2):
-            letter1 = available_letters[i]
-            letter2 = available_letters[i + 1]
-
-            # Create symmetrical mapping
-            self.reflector_mappings[letter1] = letter2
-            self.reflector_mappings[letter2] = letter1
+        self._randomize_reflector(rng)
+
+    @classmethod
+    def from_table(cls, reflector_table, alphabet=UPPERCASE):
+        """Build a reflector around an existing wiring table"""
+        reflector = cls.__new__(cls)
+        reflector.alphabet = alphabet
+        reflector.reflector_table = reflector_table
+        symbols = alphabet.symbols
+        reflector.reflector_mappings = {symbols[i]: symbols[mapped] for i, mapped in enumerate(reflector_table)}
+        return reflector
+
+    def _randomize_reflector(self, rng):
+        size = self.alphabet.size
+        available_indices = list(range(size))
+        rng.shuffle(available_indices)
+
+        # Create size / 2 symmetrical pairs
+        self.reflector_table = [0] * size
+        for i in range(0, size, 2):
+            index1 = available_indices[i]
+            index2 = available_indices[i + 1]
+            self.reflector_table[index1] = index2
+            self.reflector_table[index2] = index1
+
+        symbols = self.alphabet.symbols
+        self.reflector_mappings = {
+            symbols[index1]: symbols[available_indices[i ^ 1]] for i, index1 in enumerate(available_indices)
+        }
         logger.debug("Reflector mappings:")
         logger.debug(self.reflector_mappings)
 
     def reflect(self, letter):
-        letter = letter.upper()
-        reflected_letter = self.reflector_mappings[letter]
+        reflected_letter = self.alphabet.symbol(self.reflector_table[self.alphabet.index(letter)])
         logger.debug(f"Letter {letter} reflected to {reflected_letter}")
         return reflected_letter
@@ -1,6 +1,8 @@
 import random
 import logging
 
+from alphabet import UPPERCASE
+
 logger = logging.getLogger(__name__)
 
 
@@ -9,11 +11,27 @@ class Rotor:
     Enigmа rotor simulation
     """
 
-    def __init__(self):
+    def __init__(self, alphabet=UPPERCASE, rng=random):
+        self.alphabet = alphabet
         self.initial_position = 0
         self.current_position = self.initial_position
+        self.forward_table = []
+        self.reverse_table = []
         self.rotor_mappings = {}
-        self._randomize_rotor()
+        self._randomize_rotor(rng)
+
+    @classmethod
+    def from_tables(cls, forward_table, reverse_table, alphabet=UPPERCASE, initial_position=0):
+        """Build a rotor around existing wiring tables instead of random wiring"""
+        rotor = cls.__new__(cls)
+        rotor.alphabet = alphabet
+        rotor.initial_position = initial_position
+        rotor.current_position = initial_position
+        rotor.forward_table = forward_table
+        rotor.reverse_table = reverse_table
+        symbols = alphabet.symbols
+        rotor.rotor_mappings = {symbols[i]: symbols[mapped] for i, mapped in enumerate(forward_table)}
+        return rotor
 
     def reset_position(self):
         self.current_position = self.initial_position
@@ -21,33 +39,38 @@ class Rotor:
     def set_initial_position(self, position):
         if not isinstance(position, int):
             raise TypeError("Rotor position must be an integer")
-        self.initial_position = position % 26
+        self.initial_position = position % self.alphabet.size
         self.current_position = self.initial_position
 
     # setup a random rotor mapping
-    def _randomize_rotor(self):
-        positions = [chr(i) for i in range(ord('A'), ord('Z') + 1)]
-        for i in range(ord('A'), ord('Z') + 1):
-            random_position = random.choice(positions)
-            self.rotor_mappings[chr(i)] = random_position
+    def _randomize_rotor(self, rng):
+        size = self.alphabet.size
+        positions = list(range(size))
+        self.forward_table = []
+        for _ in range(size):
+            random_position = rng.choice(positions)
+            self.forward_table.append(random_position)
             positions.remove(random_position)
+        self.reverse_table = [0] * size
+        for index, mapped in enumerate(self.forward_table):
+            self.reverse_table[mapped] = index
+        symbols = self.alphabet.symbols
+        self.rotor_mappings = {symbols[i]: symbols[mapped] for i, mapped in enumerate(self.forward_table)}
 
     def rotate(self):
-        self.current_position = (self.current_position + 1) % 26
+        self.current_position = (self.current_position + 1) % self.alphabet.size
         logger.debug(f"Rotor rotated to position {self.current_position}")
         return self.current_position
 
+    def forward(self, index):
+        return self.forward_table[(index + self.current_position) % self.alphabet.size]
+
+    def reverse(self, index):
+        # Un-rotate the wiring input by current_position
+        return (self.reverse_table[index] - self.current_position) % self.alphabet.size
+
     def get_mapping(self, letter):
-        letter = letter.upper()
-        rotated_letter = chr((ord(letter) - ord('A') + self.current_position) % 26 + ord('A'))
-        mapped_letter = self.rotor_mappings[rotated_letter]
-        return mapped_letter
+        return self.alphabet.symbol(self.forward(self.alphabet.index(letter)))
 
     def get_reverse_mapping(self, letter):
-        letter = letter.upper()
-        for key, value in self.rotor_mappings.items():
-            if value == letter:
-                # Un-rotate the key by current_position
-                unrotated_letter = chr((ord(key) - ord('A') - self.current_position) % 26 + ord('A'))
-                return unrotated_letter
-        raise ValueError("Letter must be between A-Z")
+        return self.alphabet.symbol(self.reverse(self.alphabet.index(letter)))
@@ -0,0 +1,306 @@
+"""
+Compiled machine tables in shared memory.
+
+A machine's wiring (rotor, reflector and patchboard tables, start positions)
+and optionally the core table for every position of rotors 1..n are written
+once into a multiprocessing.shared_memory block. Other processes attach to it
+by name and build machines whose tables are views into that block, so a host
+holds one copy however many worker processes use it.
+
+Blocks are reference counted: publishing or attaching takes a reference and
+release() drops it, unlinking the block when the last reference goes. The
+count is kept in a small lock file in the temp directory and only changed
+while holding a lock on it. Blocks are not registered with multiprocessing's
+resource tracker, which would unlink them when the first attached process
+exits; a block whose holders crashed can be removed with unlink_tables().
+The lock file goes with the block.
+
+Block layout (native byte order):
+    header      TABLES_HEADER (magic, version, size, rotors, cores, alphabet)
+    positions   rotor start positions
+    rotors      forward then reverse table per rotor
+    reflector   reflector table
+    patchboard  patchboard table
+    cores       optional: one core table per position of rotors 1..n, rotor 1
+                the least significant digit
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+import struct
+import tempfile
+import weakref
+from array import array
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+from alphabet import alphabet_name, get_alphabet
+from cycles import counter_to_positions, positions_to_counter
+from enigmamachine import EnigmaMachine
+from plugboard import PatchBoard
+from reflector import Reflector
+from rotor import Rotor
+
+TABLES_MAGIC = b"ENIGTAB1"
+TABLES_VERSION = 1
+TABLES_HEADER = struct.Struct("=8sIIII16s")
+MAX_CORE_BYTES = 256 * 1024 * 1024
+
+
+def _typecode(size: int) -> str:
+    return "B" if size <= 256 else "H"
+
+
+def cores_fit(machine: EnigmaMachine) -> bool:
+    """Whether the core tables for machine fit within MAX_CORE_BYTES"""
+    size = machine.alphabet.size
+    return size ** machine.num_rotors * array(_typecode(size)).itemsize <= MAX_CORE_BYTES
+
+
+def compile_tables(machine: EnigmaMachine, include_cores: bool = False) -> bytes:
+    """Flatten a machine's tables into the block body (everything after the header)"""
+    size = machine.alphabet.size
+    body = array(_typecode(size), [rotor.initial_position for rotor in machine.rotors])
+    for rotor in machine.rotors:
+        body.extend(rotor.forward_table)
+        body.extend(rotor.reverse_table)
+    body.extend(machine.reflector.reflector_table)
+    body.extend(machine.patchboard.forward_table)
+    if include_cores:
+        if not cores_fit(machine):
+            raise ValueError("Core tables for this configuration are too large to share")
+        for counter in range(size ** (machine.num_rotors - 1)):
+            body.extend(machine.core_table(counter_to_positions(counter, size, machine.num_rotors - 1)))
+    return body.tobytes()
+
+
+def _lock_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"{name.lstrip('/')}.lock")
+
+
+class _RefCount:
+    """The reference count stored in a locked lock file"""
+
+    def __init__(self, lock_file) -> None:
+        self._file = lock_file
+
+    def get(self) -> int:
+        self._file.seek(0)
+        text = self._file.read().strip()
+        return int(text) if text else 0
+
+    def set(self, refs: int) -> None:
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(refs).encode("ascii"))
+        self._file.flush()
+
+
+def _open_lock(name: str):
+    """Open and lock the lock file, retrying if it was removed while we waited"""
+    path = _lock_path(name)
+    while True:
+        lock_file = open(path, "a+b")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+@contextmanager
+def _locked(name: str):
+    with _open_lock(name) as lock_file:
+        try:
+            yield _RefCount(lock_file)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _remove_lock(name: str) -> None:
+    # only while holding the lock, so waiters notice and open a fresh file
+    try:
+        os.unlink(_lock_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def _open_block(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    block = shared_memory.SharedMemory(name=name, create=create, size=size)
+    # lifetime is managed by the reference count, not by whichever process exits first
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def _unlink_block(block: shared_memory.SharedMemory) -> None:
+    # unlink() unregisters the block from the tracker, so register it back first
+    resource_tracker.register(block._name, "shared_memory")
+    block.unlink()
+
+
+def unlink_tables(name: str) -> None:
+    """Remove a block regardless of its reference count"""
+    with _locked(name):
+        try:
+            block = _open_block(name)
+        except FileNotFoundError:
+            pass
+        else:
+            block.close()
+            _unlink_block(block)
+        _remove_lock(name)
+
+
+class SharedCoreTables:
+    """Read-only core table cache over shared memory, usable as encrypt_indices' core_cache"""
+
+    def __init__(self, tables: memoryview, size: int) -> None:
+        self._tables = tables
+        self._size = size
+
+    def get(self, positions: tuple[int, ...], default=None) -> memoryview:
+        start = positions_to_counter(list(positions), self._size) * self._size
+        return self._tables[start:start + self._size]
+
+    __getitem__ = get
+
+
+class SharedTables:
+    """One process's reference to a block of compiled tables"""
+
+    def __init__(self, block: shared_memory.SharedMemory) -> None:
+        self._block = block
+        magic, version, size, num_rotors, has_cores, stored_alphabet = TABLES_HEADER.unpack_from(block.buf)
+        if magic != TABLES_MAGIC or version != TABLES_VERSION:
+            block.close()
+            raise ValueError(f"Shared memory block {block.name} does not hold Enigma tables")
+        self.name = block.name
+        self.alphabet = get_alphabet(stored_alphabet.rstrip(b"\0").decode("ascii"))
+        self.num_rotors = num_rotors
+        self.has_cores = bool(has_cores)
+
+        itemsize = array(_typecode(size)).itemsize
+        wiring = num_rotors + (2 * num_rotors + 2) * size
+        cores = size ** num_rotors if has_cores else 0
+        self._view_end = TABLES_HEADER.size + (wiring + cores) * itemsize
+        self._view = self._open_view()
+        # machines and core caches handed out, which hold views into the block
+        self._users = weakref.WeakSet()
+        self._released = False
+
+    def _open_view(self) -> memoryview:
+        return self._block.buf[TABLES_HEADER.size:self._view_end].cast(_typecode(self.alphabet.size))
+
+    @classmethod
+    def publish(
+        cls, machine: EnigmaMachine, name: str | None = None, include_cores: bool = False
+    ) -> "SharedTables":
+        """
+        Write machine's tables to shared memory and return a reference to
+        them. The default name is derived from the tables, so publishing the
+        same configuration again attaches to the existing block.
+        """
+        body = compile_tables(machine, include_cores)
+        if name is None:
+            name = "enigma-" + hashlib.blake2b(body, digest_size=8).hexdigest()
+        header = TABLES_HEADER.pack(
+            TABLES_MAGIC, TABLES_VERSION, machine.alphabet.size, machine.num_rotors,
+            int(include_cores), alphabet_name(machine.alphabet).encode("ascii"),
+        )
+        with _locked(name) as refs:
+            try:
+                block = _open_block(name, create=True, size=len(header) + len(body))
+            except FileExistsError:
+                return cls._attach_locked(name, refs)
+            block.buf[:len(header)] = header
+            block.buf[len(header):len(header) + len(body)] = body
+            tables = cls(block)
+            refs.set(1)
+        return tables
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedTables":
+        """Take a reference to a published block"""
+        with _locked(name) as refs:
+            return cls._attach_locked(name, refs)
+
+    @classmethod
+    def _attach_locked(cls, name: str, refs: _RefCount) -> "SharedTables":
+        try:
+            block = _open_block(name)
+        except FileNotFoundError:
+            if refs.get() == 0:
+                _remove_lock(name)
+            raise
+        tables = cls(block)
+        refs.set(refs.get() + 1)
+        return tables
+
+    def __enter__(self) -> "SharedTables":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    @property
+    def refs(self) -> int:
+        with _locked(self.name) as refs:
+            return refs.get()
+
+    def machine(self) -> EnigmaMachine:
+        """A machine at its start positions whose wiring tables are views into the block"""
+        size = self.alphabet.size
+        view = self._view
+        offset = self.num_rotors
+        rotors = []
+        for position in view[:self.num_rotors]:
+            rotors.append(Rotor.from_tables(
+                view[offset:offset + size], view[offset + size:offset + 2 * size], self.alphabet, position
+            ))
+            offset += 2 * size
+        reflector = Reflector.from_table(view[offset:offset + size], self.alphabet)
+        patchboard = PatchBoard.from_table(view[offset + size:offset + 2 * size], self.alphabet)
+        machine = EnigmaMachine.from_components(rotors, reflector, patchboard)
+        self._users.add(machine)
+        return machine
+
+    @property
+    def core_cache(self) -> SharedCoreTables | None:
+        """Precomputed core tables to pass as core_cache, if they were published"""
+        if not self.has_cores:
+            return None
+        start = self.num_rotors + (2 * self.num_rotors + 2) * self.alphabet.size
+        cores = SharedCoreTables(self._view[start:], self.alphabet.size)
+        self._users.add(cores)
+        return cores
+
+    def release(self) -> None:
+        """
+        Drop this reference, unlinking the block if it was the last one.
+        Machines built from this reference must be gone by then.
+        """
+        if self._released:
+            return
+        if self._users:
+            raise RuntimeError("Machines built from these shared tables are still in use")
+        self._view.release()
+        try:
+            self._block.close()
+        except BufferError:
+            # something else still holds a view (a rotor kept from a machine):
+            # close() dropped the block's buffer but left it mapped, so restore
+            # both views and keep this reference usable
+            self._block._buf = memoryview(self._block._mmap)
+            self._view = self._open_view()
+            raise RuntimeError("Views into these shared tables are still in use") from None
+        self._released = True
+        with _locked(self.name) as refs:
+            remaining = max(refs.get() - 1, 0)
+            refs.set(remaining)
+            if remaining == 0:
+                _unlink_block(self._block)
+                _remove_lock(self.name)
@@ -2,11 +2,48 @@
 Unit tests for Enigma Machine Simulator
 """
 import unittest
+from unittest import mock
 import logging
+import random
+import io
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+from pathlib import Path
 from enigmamachine import EnigmaMachine
 from rotor import Rotor
 from reflector import Reflector
 from plugboard import PatchBoard
+from alphabet import Alphabet, ALPHANUMERIC, BYTES, UPPERCASE, alphabet_name
+from batch import KeyConfig, encrypt_batch
+from bulk import encrypt_tree
+from container import ContainerReader, open_container
+import cycles
+from cycles import CycleCatalog, build_catalog, cycle_structure
+from web_server import SESSION_STORE, EnigmaRequestHandler
+from hillclimb import NgramModel, recover_plugboard
+from loadgen import parse_mix, percentile, run_load
+from web_workers import find_session_id, session_generation, session_worker
+from web_socket import OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG, OPCODE_TEXT, WebSocketClosed, accept_key, read_message
+
+# the daemon needs Unix domain sockets and shared tables need fcntl locks
+HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+if HAS_UNIX_SOCKETS:
+    from daemon import EnigmaClient, EnigmaDaemon
+try:
+    from shared_tables import SharedTables, unlink_tables
+    HAS_SHARED_TABLES = True
+except ImportError:
+    HAS_SHARED_TABLES = False
 
 # Disable logging during tests
 logging.disable(logging.CRITICAL)
@@ -260,6 +297,21 @@ class TestEnigmaMachine(unittest.TestCase):
                 f"Failed with {num_rotors} rotors"
             )
 
+    def test_advance_matches_typing(self):
+        """Test advance jumps to the same rotor positions as typing that many letters"""
+        enigma = EnigmaMachine(num_rotors=3)
+        enigma.rotors[0].current_position = 20
+        enigma.rotors[1].current_position = 25
+        for steps in (1, 6, 7, 700):
+            positions = [rotor.current_position for rotor in enigma.rotors]
+            for _ in range(steps):
+                enigma._rotate_rotors()
+            typed = [rotor.current_position for rotor in enigma.rotors]
+            for rotor, position in zip(enigma.rotors, positions):
+                rotor.current_position = position
+            enigma.advance(steps)
+            self.assertEqual(typed, [rotor.current_position for rotor in enigma.rotors])
+
     def test_reset_returns_to_initial_seeded_positions(self):
         """Reset should restore each rotor to its startup position, not always zero."""
         enigma = EnigmaMachine(num_rotors=3, seed=123, randomize_positions=True)
@@ -271,6 +323,779 @@ class TestEnigmaMachine(unittest.TestCase):
         self.assertEqual(initial_positions, reset_positions)
 
 
+class TestAlphabet(unittest.TestCase):
+    """Test cases for Alphabet class and alphabet-sized machines"""
+
+    def setUp(self):
+        """Keep seeded machines from changing the random state seen by other tests"""
+        self.random_state = random.getstate()
+
+    def tearDown(self):
+        random.setstate(self.random_state)
+
+    def test_index_folds_case(self):
+        """Test case-folding alphabets accept lowercase symbols"""
+        self.assertEqual(UPPERCASE.index('a'), 0)
+        self.assertEqual(UPPERCASE.index('Z'), 25)
+
+    def test_unknown_symbol_not_in_alphabet(self):
+        """Test symbols outside the alphabet are rejected"""
+        self.assertNotIn('1', UPPERCASE)
+        with self.assertRaises(ValueError):
+            UPPERCASE.index('1')
+
+    def test_odd_alphabet_rejected(self):
+        """Test alphabets must have an even size so reflector pairs cover them"""
+        with self.assertRaises(ValueError):
+            Alphabet("ABC")
+
+    def test_components_sized_to_alphabet(self):
+        """Test rotor, reflector and patchboard tables match the alphabet size"""
+        self.assertEqual(len(Rotor(ALPHANUMERIC).rotor_mappings), 36)
+        self.assertEqual(len(Reflector(ALPHANUMERIC).reflector_mappings), 36)
+        self.assertEqual(len(PatchBoard(BYTES).forward_table), 256)
+
+    def test_alphanumeric_encrypts_digits(self):
+        """Test digits are encrypted with an alphanumeric alphabet"""
+        enigma = EnigmaMachine(num_rotors=3, seed=5, alphabet=ALPHANUMERIC)
+        message = "AGENT 007 AT 1200"
+        encrypted = enigma.encrypt_message(message)
+        self.assertNotEqual(message, encrypted)
+        self.assertEqual(message.count(' '), encrypted.count(' '))
+        self.assertEqual(message, enigma.encrypt_message(encrypted))
+
+    def test_bytes_round_trip(self):
+        """Test arbitrary binary data round-trips through a 256-symbol machine"""
+        enigma = EnigmaMachine(num_rotors=3, seed=9, alphabet=BYTES)
+        data = bytes(range(256)) * 4
+        encrypted = enigma.encrypt_bytes(data)
+        self.assertNotEqual(data, encrypted)
+        self.assertEqual(data, enigma.encrypt_bytes(encrypted))
+
+    def test_encrypt_bytes_requires_byte_alphabet(self):
+        """Test encrypt_bytes rejects alphabets that cannot hold every byte"""
+        with self.assertRaises(ValueError):
+            EnigmaMachine(num_rotors=3).encrypt_bytes(b"DATA")
+
+    def test_encrypt_chunk_passes_other_bytes_through(self):
+        """Test chunked Latin-1 encryption only changes alphabet bytes and continues the stream"""
+        enigma = EnigmaMachine(num_rotors=3, alphabet=UPPERCASE, rng=random.Random(5))
+        expected = enigma.encrypt_text("HELLO, WORLD 42").encode("latin-1")
+        enigma.reset_rotors()
+        self.assertEqual(expected, enigma.encrypt_chunk(b"HELLO, W") + enigma.encrypt_chunk(b"ORLD 42"))
+
+    def test_alphabet_name(self):
+        """Test named alphabets are found and unnamed ones rejected"""
+        self.assertEqual("bytes", alphabet_name(BYTES))
+        with self.assertRaises(ValueError):
+            alphabet_name(Alphabet("AB"))
+
+    def test_table_path_matches_letter_path(self):
+        """Test the table-driven message path matches per-letter encryption"""
+        message = "THE QUICK BROWN FOX " * 40
+        enigma = EnigmaMachine(num_rotors=3, seed=42, randomize_positions=True)
+        expected = "".join(
+            enigma.encrypt_letter(letter) if letter != " " else letter for letter in message
+        )
+        enigma.reset_rotors()
+        self.assertEqual(expected, enigma.encrypt_message(message))
+
+
+class TestBatch(unittest.TestCase):
+    """Test cases for multi-key batch encryption"""
+
+    def setUp(self):
+        """Keep seeded machines from changing the random state seen by other tests"""
+        self.random_state = random.getstate()
+
+    def tearDown(self):
+        random.setstate(self.random_state)
+
+    def test_batch_matches_individual_machines(self):
+        """Test each batch result equals a machine built from the same config"""
+        message = "ATTACK AT DAWN, HOLD THE LINE"
+        configs = [
+            KeyConfig(seed=1),
+            KeyConfig(seed=2, num_rotors=5, randomize_positions=True),
+            KeyConfig(seed=1, positions=(3, 25, 7)),
+        ]
+        expected = [
+            EnigmaMachine(num_rotors=3, seed=1).encrypt_message(message),
+            EnigmaMachine(num_rotors=5, seed=2, randomize_positions=True).encrypt_message(message),
+        ]
+        enigma = EnigmaMachine(num_rotors=3, seed=1)
+        for rotor, position in zip(enigma.rotors, (3, 25, 7)):
+            rotor.set_initial_position(position)
+        expected.append(enigma.encrypt_message(message))
+
+        self.assertEqual(expected, encrypt_batch(configs, message))
+
+    def test_batch_position_sweep_round_trip(self):
+        """Test a sweep of start positions over one seed decrypts under the same sweep"""
+        configs = [KeyConfig(seed=3, positions=(0, position, 0)) for position in range(26)]
+        message = "A" * 100
+        encrypted = encrypt_batch(configs, message)
+        self.assertEqual(len(set(encrypted)), 26)
+        for config, cypher_text in zip(configs, encrypted):
+            self.assertEqual([message], encrypt_batch([config], cypher_text))
+
+    def test_batch_bytes(self):
+        """Test bytes messages are encrypted under a 256-symbol alphabet"""
+        configs = [KeyConfig(seed=seed) for seed in range(3)]
+        data = bytes(range(256))
+        expected = [EnigmaMachine(seed=seed, alphabet=BYTES).encrypt_bytes(data) for seed in range(3)]
+        self.assertEqual(expected, encrypt_batch(configs, data, alphabet=BYTES))
+
+    def test_batch_rejects_wrong_position_count(self):
+        """Test positions must cover every rotor"""
+        with self.assertRaises(ValueError):
+            encrypt_batch([KeyConfig(seed=1, positions=(1, 2))], "HELLO")
+
+
+class TestBulk(unittest.TestCase):
+    """Test cases for directory bulk encryption"""
+
+    def setUp(self):
+        """Create an input tree in a temporary directory"""
+        self.random_state = random.getstate()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        (self.root / "in" / "sub").mkdir(parents=True)
+        (self.root / "in" / "data.bin").write_bytes(bytes(range(256)) * 10)
+        (self.root / "in" / "sub" / "note.txt").write_bytes(b"HELLO, WORLD 42")
+
+    def tearDown(self):
+        random.setstate(self.random_state)
+        self.temp_dir.cleanup()
+
+    def test_tree_round_trip(self):
+        """Test encrypting the output tree with the same key restores the inputs"""
+        encrypt_tree(str(self.root / "in"), str(self.root / "out"), seed=8, workers=1)
+        encrypt_tree(str(self.root / "out"), str(self.root / "back"), seed=8, workers=1)
+        for name in ("data.bin", "sub/note.txt"):
+            original = (self.root / "in" / name).read_bytes()
+            self.assertNotEqual(original, (self.root / "out" / name).read_bytes())
+            self.assertEqual(original, (self.root / "back" / name).read_bytes())
+
+    def test_text_alphabet_passes_other_bytes_through(self):
+        """Test a letter alphabet only changes letters"""
+        encrypt_tree(str(self.root / "in" / "sub"), str(self.root / "out"), seed=8, alphabet_name="uppercase")
+        encrypted = (self.root / "out" / "note.txt").read_bytes()
+        self.assertEqual(encrypted[5:7], b", ")
+        self.assertEqual(encrypted[-3:], b" 42")
+        self.assertEqual(EnigmaMachine(seed=8).encrypt_message("HELLO, WORLD 42").encode(), encrypted)
+
+    def test_unchanged_files_skipped(self):
+        """Test a re-run only processes files whose size or mtime changed"""
+        encrypt_tree(str(self.root / "in"), str(self.root / "out"), seed=8, workers=1)
+        (self.root / "in" / "sub" / "note.txt").write_bytes(b"CHANGED")
+        results = encrypt_tree(str(self.root / "in"), str(self.root / "out"), seed=8, workers=1)
+        processed = [Path(result.path).name for result in results if not result.skipped]
+        self.assertEqual(["note.txt"], processed)
+
+        results = encrypt_tree(str(self.root / "in"), str(self.root / "out"), seed=9, workers=1)
+        self.assertFalse(any(result.skipped for result in results))
+
+    @unittest.skipUnless(HAS_SHARED_TABLES, "shared tables need fcntl")
+    def test_shared_tables_skip_cores_for_small_trees(self):
+        """Test sharing tables publishes wiring only when cores would not pay off or fit"""
+        encrypt_tree(str(self.root / "in"), str(self.root / "plain"), seed=8, num_rotors=4, workers=1)
+        with mock.patch("shared_tables.SharedTables.publish", wraps=SharedTables.publish) as publish:
+            encrypt_tree(
+                str(self.root / "in"), str(self.root / "shared"), seed=8, num_rotors=4, workers=2, share_tables=True
+            )
+        self.assertFalse(publish.call_args.kwargs["include_cores"])
+        for name in ("data.bin", "sub/note.txt"):
+            self.assertEqual(
+                (self.root / "plain" / name).read_bytes(), (self.root / "shared" / name).read_bytes()
+            )
+
+
+class TestContainer(unittest.TestCase):
+    """Test cases for the seekable container format"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "log.enc"
+        self.data = b"".join(f"record {index:05d}: attack at dawn\n".encode("ascii") for index in range(2000))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_ranges_match_whole_stream(self):
+        """Test any byte range decrypts to the same bytes as the original"""
+        for alphabet in (BYTES, UPPERCASE):
+            machine = EnigmaMachine(num_rotors=3, alphabet=alphabet, rng=random.Random(4))
+            with machine.container_writer(self.path, block_size=1000) as writer:
+                writer.write(self.data[:12345])
+                writer.write(self.data[12345:])
+            self.assertNotIn(b"attack", self.path.read_bytes())
+
+            expected = self.data if alphabet is BYTES else self.data.upper()
+            with open_container(self.path, seed=4) as reader:
+                self.assertEqual(len(self.data), len(reader))
+                self.assertEqual(expected, reader.read())
+                for start, stop in ((0, 1), (999, 1001), (31337, 40000), (len(self.data) - 3, None)):
+                    self.assertEqual(expected[start:stop], reader.read(start, stop))
+
+    def test_append_continues_stream(self):
+        """Test appending gives the same container as writing in one go"""
+        machine = EnigmaMachine(num_rotors=3, alphabet=BYTES, rng=random.Random(4))
+        with machine.container_writer(self.path, block_size=1000) as writer:
+            writer.write(self.data[:5500])
+        with machine.container_writer(self.path, append=True) as writer:
+            writer.write(self.data[5500:])
+        appended = self.path.read_bytes()
+        with machine.container_writer(self.path, block_size=1000) as writer:
+            writer.write(self.data)
+        self.assertEqual(self.path.read_bytes(), appended)
+
+    def test_configuration_mismatch_rejected(self):
+        """Test a reader with a different rotor count is refused"""
+        machine = EnigmaMachine(num_rotors=3, alphabet=BYTES, rng=random.Random(4))
+        with machine.container_writer(self.path) as writer:
+            writer.write(self.data)
+        with self.assertRaises(ValueError):
+            ContainerReader(self.path, EnigmaMachine(num_rotors=4, alphabet=BYTES, rng=random.Random(4)))
+
+    def test_start_positions_stored(self):
+        """Test a machine that does not start at zero reads back through open_container"""
+        machine = EnigmaMachine(num_rotors=3, alphabet=BYTES, rng=random.Random(4))
+        for rotor, position in zip(machine.rotors, (17, 200, 3)):
+            rotor.set_initial_position(position)
+        with machine.container_writer(self.path, block_size=1000) as writer:
+            writer.write(self.data)
+        with open_container(self.path, seed=4) as reader:
+            self.assertEqual(self.data, reader.read())
+            self.assertEqual(self.data[4321:5678], reader.read(4321, 5678))
+        with self.assertRaises(ValueError):
+            ContainerReader(self.path, EnigmaMachine(num_rotors=3, alphabet=BYTES, rng=random.Random(4)))
+
+
+@unittest.skipUnless(HAS_SHARED_TABLES, "shared tables need fcntl")
+class TestSharedTables(unittest.TestCase):
+    """Test cases for machine tables published in shared memory"""
+
+    def setUp(self):
+        self.machine = EnigmaMachine(num_rotors=3, alphabet=UPPERCASE, rng=random.Random(6))
+        self.name = f"enigma-test-{os.getpid()}"
+
+    def tearDown(self):
+        unlink_tables(self.name)
+
+    def test_shared_machine_matches_original(self):
+        """Test a machine built from shared tables and cores encrypts like the original"""
+        message = "THEQUICKBROWNFOXJUMPSOVERTHELAZYDOG" * 40
+        expected = self.machine.encrypt_text(message)
+        with SharedTables.publish(self.machine, name=self.name, include_cores=True) as tables:
+            shared = tables.machine()
+            indices = [UPPERCASE.index(letter) for letter in message]
+            output = shared.encrypt_indices(indices, tables.core_cache)
+            self.assertEqual(expected, "".join(UPPERCASE.symbol(index) for index in output))
+            self.assertEqual(self.machine.rotors[0].rotor_mappings, shared.rotors[0].rotor_mappings)
+            del shared
+
+    def test_reference_counting(self):
+        """Test the block lives until the last reference is released"""
+        tables = SharedTables.publish(self.machine, name=self.name)
+        other = SharedTables.attach(self.name)
+        self.assertEqual(2, tables.refs)
+
+        machine = other.machine()
+        with self.assertRaises(RuntimeError):
+            other.release()
+        self.assertEqual(machine.encrypt_text("HELLO"), other.machine().encrypt_text("HELLO"))
+        rotor = machine.rotors[0]
+        del machine
+        with self.assertRaises(RuntimeError):
+            other.release()
+        self.assertEqual(2, tables.refs)
+        self.assertEqual(rotor.forward_table[0], other.machine().rotors[0].forward_table[0])
+        del rotor
+        other.release()
+        self.assertEqual(1, tables.refs)
+
+        tables.release()
+        lock_path = Path(tempfile.gettempdir()) / f"{self.name}.lock"
+        self.assertFalse(lock_path.exists())
+        with self.assertRaises(FileNotFoundError):
+            SharedTables.attach(self.name)
+        self.assertFalse(lock_path.exists())
+
+
+@unittest.skipUnless(HAS_UNIX_SOCKETS, "the daemon needs Unix domain sockets")
+class TestDaemon(unittest.TestCase):
+    """Test cases for the Unix socket encryption daemon"""
+
+    def setUp(self):
+        """Start a daemon on a temporary socket"""
+        self.random_state = random.getstate()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.socket_path = str(Path(self.temp_dir.name) / "enigma.sock")
+        self.server = EnigmaDaemon(self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = EnigmaClient(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+        random.setstate(self.random_state)
+
+    def test_encrypt_matches_machine(self):
+        """Test daemon output matches a locally built machine"""
+        message = "Hello, World"
+        expected = EnigmaMachine(num_rotors=4, seed=11).encrypt_message(message)
+        self.assertEqual(expected, self.client.encrypt(message, seed=11, num_rotors=4))
+        self.assertEqual(message.upper(), self.client.decrypt(expected, seed=11, num_rotors=4))
+
+    def test_bytes_and_positions(self):
+        """Test binary payloads and explicit start positions"""
+        data = bytes(range(256))
+        encrypted = self.client.encrypt(data, seed=2, alphabet="bytes", positions=[1, 2, 3])
+        self.assertEqual(data, self.client.encrypt(encrypted, seed=2, alphabet="bytes", positions=[1, 2, 3]))
+
+    def test_errors_keep_connection_open(self):
+        """Test a bad request reports an error and the connection stays usable"""
+        with self.assertRaises(ValueError):
+            self.client.encrypt("HELLO", seed=1, alphabet="klingon")
+        self.client.ping()
+
+    def test_running_daemon_not_replaced(self):
+        """Test a second daemon refuses a live socket but takes over a stale one"""
+        with self.assertRaises(RuntimeError):
+            EnigmaDaemon(self.socket_path)
+        self.client.ping()
+
+        stale_path = str(Path(self.temp_dir.name) / "stale.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(stale_path)  # bound but never listening, like a crashed daemon
+        server = EnigmaDaemon(stale_path)
+        server.server_close()
+
+    def test_malformed_headers_keep_connection_open(self):
+        """Test non-object headers and rotor counts below one get an error reply"""
+        for header in ([1, 2], "encrypt", {"op": "encrypt", "seed": 1, "numRotors": 0},
+                       {"op": "encrypt", "seed": 1, "numRotors": -2}):
+            with self.assertRaises(ValueError):
+                self.client.request(header, b"HELLO")
+        self.client.ping()
+
+    def test_unexpected_error_keeps_connection_open(self):
+        """Test an unexpected exception is reported instead of dropping the connection"""
+        with mock.patch("daemon.handle_request", side_effect=RuntimeError("boom")):
+            with self.assertRaisesRegex(ValueError, "boom"):
+                self.client.ping()
+        self.client.ping()
+
+
+def masked_frame(opcode, payload, fin=True):
+    """Build a client (masked) WebSocket frame"""
+    mask = os.urandom(4)
+    masked = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+    length = len(payload)
+    header = struct.pack("!BB", (0x80 if fin else 0) | opcode, 0x80 | length) if length < 126 else \
+        struct.pack("!BBH", (0x80 if fin else 0) | opcode, 0x80 | 126, length)
+    return header + mask + masked
+
+
+class TestWebSocket(unittest.TestCase):
+    """Test cases for the WebSocket framing used by the web server"""
+
+    def test_accept_key(self):
+        """Test the handshake key matches the RFC 6455 example"""
+        self.assertEqual(accept_key("dGhlIHNhbXBsZSBub25jZQ=="), "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=")
+
+    def test_read_fragmented_text_and_ping(self):
+        """Test fragments are reassembled and pings answered in between"""
+        frames = (
+            masked_frame(OPCODE_TEXT, b"HEL" * 50, fin=False)
+            + masked_frame(OPCODE_PING, b"hi")
+            + masked_frame(0, b"LO")
+        )
+        output = io.BytesIO()
+        opcode, payload = read_message(io.BytesIO(frames), output)
+        self.assertEqual((OPCODE_TEXT, b"HEL" * 50 + b"LO"), (opcode, payload))
+        self.assertEqual(bytes([0x80 | OPCODE_PONG, 2]) + b"hi", output.getvalue())
+
+    def test_close_raises(self):
+        """Test a close frame ends the message loop"""
+        with self.assertRaises(WebSocketClosed):
+            read_message(io.BytesIO(masked_frame(OPCODE_CLOSE, struct.pack("!H", 1000))), io.BytesIO())
+
+
+class TestCycleCatalog(unittest.TestCase):
+    """Test cases for the Rejewski characteristic catalog"""
+
+    def setUp(self):
+        """Build a small two-rotor catalog in a temporary directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "catalog.bin"
+        build_catalog(str(self.path), seed=6, num_rotors=2, workers=1, chunk_size=100)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_cycle_structure(self):
+        """Test cycle lengths are found and sorted longest first"""
+        self.assertEqual(cycle_structure([1, 2, 0, 4, 3, 5]), (3, 2, 1))
+
+    def test_characteristic_matches_machine(self):
+        """Test a catalog entry equals the products of the machine's permutations"""
+        enigma = EnigmaMachine(num_rotors=2, rng=random.Random(6))
+        for rotor, position in zip(enigma.rotors, (25, 3)):
+            rotor.current_position = position
+        permutations = []
+        for _ in range(6):
+            enigma.advance(1)
+            permutations.append(enigma.permutation())
+        expected = tuple(
+            cycle_structure([second[first[index]] for index in range(26)])
+            for first, second in zip(permutations[:3], permutations[3:])
+        )
+        with CycleCatalog(self.path) as catalog:
+            self.assertEqual(len(catalog), 26 * 26)
+            self.assertEqual(expected, catalog.characteristic_at([25, 3]))
+
+    def test_query_by_characteristic(self):
+        """Test every position returned for a characteristic has that characteristic"""
+        with CycleCatalog(self.path) as catalog:
+            characteristic = catalog.characteristic_at([4, 7])
+            positions = catalog.positions_for(characteristic)
+            self.assertIn([4, 7], positions)
+            self.assertEqual(len(positions), catalog.count(characteristic))
+            for position in positions:
+                self.assertEqual(characteristic, catalog.characteristic_at(position))
+            self.assertEqual(sum(map(catalog.count, catalog.characteristics)), len(catalog))
+
+    def test_existing_catalog_reused(self):
+        """Test a catalog for the same configuration is not rebuilt"""
+        modified = self.path.stat().st_mtime_ns
+        build_catalog(str(self.path), seed=6, num_rotors=2, workers=1)
+        self.assertEqual(modified, self.path.stat().st_mtime_ns)
+
+    def test_interrupted_build_resumes(self):
+        """Test a resumed build only computes the missing chunks and matches a clean build"""
+        path = Path(self.temp_dir.name) / "resumed.bin"
+        compute = cycles._characteristic_chunk
+        calls = []
+
+        def interrupt_third(*args):
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            calls.append(args)
+            return compute(*args)
+
+        with mock.patch("cycles._characteristic_chunk", interrupt_third):
+            with self.assertRaises(KeyboardInterrupt):
+                build_catalog(str(path), seed=6, num_rotors=2, workers=1, chunk_size=100)
+        self.assertEqual(2, len(list(path.with_name("resumed.bin.parts").glob("*.part"))))
+
+        calls.clear()
+        with mock.patch("cycles._characteristic_chunk", lambda *args: calls.append(args) or compute(*args)):
+            build_catalog(str(path), seed=6, num_rotors=2, workers=1, chunk_size=100)
+        self.assertEqual(5, len(calls))  # 7 chunks of 676 positions, 2 already done
+        self.assertEqual(self.path.read_bytes(), path.read_bytes())
+
+    def test_stale_parts_discarded(self):
+        """Test parts left by a build with another seed are not merged in"""
+        path = Path(self.temp_dir.name) / "stale.bin"
+        compute = cycles._characteristic_chunk
+
+        def interrupt_second(*args):
+            if args[3] > 0:
+                raise KeyboardInterrupt
+            return compute(*args)
+
+        with mock.patch("cycles._characteristic_chunk", interrupt_second):
+            with self.assertRaises(KeyboardInterrupt):
+                build_catalog(str(path), seed=1, num_rotors=2, workers=1, chunk_size=100)
+        build_catalog(str(path), seed=6, num_rotors=2, workers=1, chunk_size=100)
+        self.assertEqual(self.path.read_bytes(), path.read_bytes())
+
+
+class QuietRequestHandler(EnigmaRequestHandler):
+    max_body_bytes = 1000
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestWebServer(unittest.TestCase):
+    """Test cases for request limits and streaming on the web server"""
+
+    def setUp(self):
+        """Start the web server on a free port and create a session"""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), QuietRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.connection = HTTPConnection("127.0.0.1", self.server.server_address[1])
+        self.session_id = self.post_json("/api/session", {"seed": 3})[1]["sessionId"]
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post_json(self, path, payload):
+        self.connection.request("POST", path, json.dumps(payload))
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_oversized_body_rejected(self):
+        """Test JSON bodies over the limit are refused without being read"""
+        status, body = self.post_json("/api/encrypt", {"sessionId": self.session_id, "message": "A" * 2000})
+        self.assertEqual(413, status)
+        self.assertIn("error", body)
+
+    def test_stream_matches_encrypt(self):
+        """Test the streaming endpoint returns what /api/encrypt would, in chunks"""
+        message = "Attack at dawn, héllo! " * 5000
+        self.connection.request("POST", f"/api/encrypt/stream?sessionId={self.session_id}", message.encode("utf-8"))
+        response = self.connection.getresponse()
+        self.assertEqual("chunked", response.getheader("Transfer-Encoding"))
+        streamed = response.read().decode("utf-8")
+
+        status, body = self.post_json("/api/encrypt", {"sessionId": self.session_id, "message": message[:500]})
+        self.assertEqual(200, status)
+        self.assertEqual(len(message), len(streamed))
+        self.assertEqual(body["output"], streamed[:500])
+
+    def test_chunked_upload_rejected(self):
+        """Test a chunked body is refused and the connection closed, not parsed as a new request"""
+        request = (
+            f"POST /api/encrypt/stream?sessionId={self.session_id} HTTP/1.1\r\nHost: x\r\n"
+            "Transfer-Encoding: chunked\r\n\r\n5\r\nHELLO\r\n0\r\n\r\n"
+        ).encode("ascii")
+        with socket.create_connection(("127.0.0.1", self.server.server_address[1])) as client:
+            client.sendall(request)
+            reply = b""
+            while chunk := client.recv(4096):
+                reply += chunk  # the server must close the connection
+        self.assertTrue(reply.startswith(b"HTTP/1.1 411"))
+        self.assertEqual(1, reply.count(b"HTTP/1.1"))
+
+    def open_websocket(self):
+        client = socket.create_connection(("127.0.0.1", self.server.server_address[1]), timeout=5)
+        client.sendall((
+            f"GET /ws?sessionId={self.session_id} HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\n"
+            "Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n"
+        ).encode("ascii"))
+        reader = client.makefile("rb")
+        self.assertTrue(reader.readline().startswith(b"HTTP/1.1 101"))
+        while reader.readline() not in (b"\r\n", b""):
+            pass
+        return client, reader
+
+    def websocket_command(self, client, reader, command):
+        client.sendall(masked_frame(OPCODE_TEXT, json.dumps(command).encode("utf-8")))
+        first, length = reader.read(2)
+        self.assertEqual(0x80 | OPCODE_TEXT, first)
+        if length == 126:
+            (length,) = struct.unpack("!H", reader.read(2))
+        return json.loads(reader.read(length))
+
+    def test_sync_rejects_bad_input(self):
+        """Test malformed sync steps and positions get an error instead of a dropped connection"""
+        bad = ({"steps": "x", "positions": [0, 0, 0]}, {"steps": -1, "positions": [0, 0, 0]},
+               {"steps": 1, "positions": None}, {"steps": 1, "positions": [0, 0]}, {"steps": 1, "positions": ["a"] * 3})
+        for command in bad:
+            status, body = self.post_json("/api/sync", dict(command, sessionId=self.session_id))
+            self.assertEqual(400, status)
+            self.assertIn("error", body)
+        status, body = self.post_json("/api/sync", {"sessionId": self.session_id, "steps": 1, "positions": [1, 0, 0]})
+        self.assertEqual((200, True), (status, body["inSync"]))
+
+        client, reader = self.open_websocket()
+        with client, reader:
+            for command in bad:
+                self.assertIn("error", self.websocket_command(client, reader, dict(command, type="sync")))
+            reply = self.websocket_command(client, reader, {"type": "sync", "steps": 1, "positions": [2, 0, 0]})
+            self.assertTrue(reply["inSync"])
+
+    def test_bad_websocket_command_keeps_channel_open(self):
+        """Test a command that raises gets an error frame and the channel carries on"""
+        client, reader = self.open_websocket()
+        with client, reader:
+            self.assertIn("error", self.websocket_command(client, reader, {"type": "keypress", "letter": 5}))
+            reply = self.websocket_command(client, reader, {"type": "keypress", "letter": "A"})
+            self.assertEqual("A", reply["input"])
+
+    def test_idle_connection_closed(self):
+        """Test a kept-alive connection that goes quiet is closed by the server"""
+        with mock.patch.object(QuietRequestHandler, "timeout", 0.2):
+            with socket.create_connection(("127.0.0.1", self.server.server_address[1]), timeout=5) as client:
+                self.assertEqual(b"", client.recv(1))
+            client, reader = self.open_websocket()
+            with client, reader:
+                time.sleep(0.4)  # WebSockets are exempt
+                self.assertIn("state", self.websocket_command(client, reader, {"type": "state"}))
+
+    def test_abandoned_stream_resets_rotors(self):
+        """Test the session rotors are reset when a stream stops early"""
+        session = SESSION_STORE.get(self.session_id)
+        session.encrypt_keypress("A")
+        stream = session.encrypt_stream(["HELLO", "WORLD"])
+        next(stream)
+        stream.close()
+        self.assertEqual([0, 0, 0], [rotor.current_position for rotor in session.machine.rotors])
+
+    def test_worker_routing(self):
+        """Test multi-worker mode finds the session and the worker that owns it"""
+        self.assertEqual(2, session_worker("2.abc", 4))
+        self.assertIsNone(session_worker("7.abc", 4))
+        self.assertIsNone(session_worker("abc", 4))
+        self.assertEqual(3, session_generation("2.3.abc"))
+        self.assertIsNone(session_generation("2.abc"))
+
+        head = b"POST /api/encrypt HTTP/1.1\r\nContent-Length: 28\r\n\r\n"
+        body = b'{"sessionId": "1.x", "a": 1}'
+        master, client = socket.socketpair()
+        with master, client:
+            client.sendall(body)
+            session_id, data = find_session_id(master, head, 1000)
+        self.assertEqual("1.x", session_id)
+        self.assertEqual(head + body, data)
+
+        query = b"GET /ws?sessionId=0.y HTTP/1.1\r\n\r\n"
+        self.assertEqual(("0.y", query), find_session_id(None, query, 1000))
+
+    @unittest.skipUnless(hasattr(socket, "send_fds") and os.path.isdir("/proc"), "needs socket.send_fds and /proc")
+    def test_dead_workers_restarted(self):
+        """Test workers get the server's limits, and killed ones are restarted with their sessions answered 503"""
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        server = subprocess.Popen(
+            [sys.executable, "web_server.py", "--host", "127.0.0.1", "--port", str(port), "--workers", "2",
+             "--max-body-bytes", "200"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+        def post(path, payload):
+            for _ in range(100):
+                connection = HTTPConnection("127.0.0.1", port, timeout=5)
+                try:
+                    connection.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+                    response = connection.getresponse()
+                    return response.status, json.loads(response.read())
+                except ConnectionRefusedError:
+                    time.sleep(0.05)
+                finally:
+                    connection.close()
+            self.fail("Server did not start")
+
+        def workers():
+            pids = []
+            for entry in os.listdir("/proc"):
+                try:
+                    with open(f"/proc/{entry}/stat") as stat:
+                        parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, ValueError, IndexError):
+                    continue
+                if parent == server.pid:
+                    pids.append(int(entry))
+            return pids
+
+        try:
+            status, body = post("/api/session", {"numRotors": 3, "seed": 1})
+            self.assertEqual(200, status)
+            session_id = body["sessionId"]
+            status, _ = post("/api/encrypt", {"sessionId": session_id, "message": "A" * 500})
+            self.assertEqual(413, status)  # limits reach the workers
+            old_workers = workers()
+            self.assertEqual(2, len(old_workers))
+            for pid in old_workers:
+                os.kill(pid, signal.SIGKILL)
+            for pid in old_workers:
+                # the kill is asynchronous: wait until the master has reaped the worker
+                for _ in range(100):
+                    if not os.path.exists(f"/proc/{pid}"):
+                        break
+                    time.sleep(0.05)
+
+            status, body = post("/api/keypress", {"sessionId": session_id, "letter": "A"})
+            self.assertEqual(503, status)
+            self.assertIn("create a new session", body["error"])
+
+            for _ in range(100):
+                status, body = post("/api/session", {"numRotors": 3, "seed": 1})
+                if status == 200:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(200, status)
+            self.assertEqual(1, session_generation(body["sessionId"]))
+            self.assertTrue(set(workers()).isdisjoint(old_workers))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            self.assertEqual(0, server.wait(10))
+
+
+class TestLoadGen(unittest.TestCase):
+    """Test cases for the web API load generator"""
+
+    def test_percentile_nearest_rank(self):
+        """Test percentiles pick the nearest-rank sample"""
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(50.0, percentile(values, 0.50))
+        self.assertEqual(99.0, percentile(values, 0.99))
+        self.assertEqual(7.0, percentile([7.0], 0.95))
+        self.assertEqual(0.0, percentile([], 0.5))
+
+    def test_parse_mix(self):
+        """Test route weights are parsed and unknown routes rejected"""
+        self.assertEqual({"keypress": 3.0, "reset": 1.0}, parse_mix("keypress=3,reset"))
+        with self.assertRaises(ValueError):
+            parse_mix("delete=1")
+
+    def test_in_process_run(self):
+        """Test a short in-process run reports every route without errors"""
+        report = run_load(sessions=2, concurrency=2, duration=0.3, seed=5, message_length=20)
+        self.assertEqual({"keypress", "encrypt", "state", "reset"}, set(report["routes"]))
+        self.assertGreater(report["total"]["requests"], 0)
+        self.assertEqual(0, report["total"]["errors"])
+        self.assertLessEqual(report["total"]["p50"], report["total"]["p99"])
+        json.dumps(report)
+
+
+class TestHillClimb(unittest.TestCase):
+    """Test cases for plugboard recovery"""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(Path(__file__).parent / "long_text.txt") as sample:
+            letters = "".join(letter for letter in sample.read().upper() if letter.isalpha())
+        # train on one part of the sample and attack a message from another
+        cls.model = NgramModel.from_text(letters[:-800], n=3)
+        cls.secret = letters[-600:]
+
+    def setUp(self):
+        self.machine = EnigmaMachine(num_rotors=3, rng=random.Random(11), randomize_positions=True)
+        self.ciphertext = self.machine.encrypt_text(self.secret)
+
+    def test_recovers_plugboard(self):
+        """Test a climb finds every pair and decrypts the message"""
+        result = recover_plugboard(self.ciphertext, self.machine, self.model, restarts=1, workers=1, seed=15)
+        self.assertEqual(self.machine.patchboard.forward_table, result.table)
+        self.assertEqual(self.secret, result.plaintext)
+        self.assertEqual(13, len(result.pairs()))
+
+    def test_incremental_score_matches_full_score(self):
+        """Test the score kept up to date by swaps equals rescoring the result"""
+        result = recover_plugboard(self.ciphertext, self.machine, self.model, restarts=2, workers=2, seed=3)
+        self.assertEqual(2, result.restarts)
+        full_score = self.model.score([UPPERCASE.index(letter) for letter in result.plaintext])
+        self.assertAlmostEqual(full_score, result.score, places=6)
+
+    def test_restarts_must_be_positive(self):
+        """Test asking for no climbs is rejected up front"""
+        for restarts in (0, -1):
+            with self.assertRaisesRegex(ValueError, "restart"):
+                recover_plugboard(self.ciphertext, self.machine, self.model, restarts=restarts, workers=1)
+
+
 class TestEnigmaIntegration(unittest.TestCase):
     """Integration tests for full encryption/decryption workflow"""
 
@@ -319,6 +1144,17 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestReflector))
     suite.addTests(loader.loadTestsFromTestCase(TestPatchBoard))
     suite.addTests(loader.loadTestsFromTestCase(TestEnigmaMachine))
+    suite.addTests(loader.loadTestsFromTestCase(TestAlphabet))
+    suite.addTests(loader.loadTestsFromTestCase(TestBatch))
+    suite.addTests(loader.loadTestsFromTestCase(TestBulk))
+    suite.addTests(loader.loadTestsFromTestCase(TestContainer))
+    suite.addTests(loader.loadTestsFromTestCase(TestSharedTables))
+    suite.addTests(loader.loadTestsFromTestCase(TestDaemon))
+    suite.addTests(loader.loadTestsFromTestCase(TestWebSocket))
+    suite.addTests(loader.loadTestsFromTestCase(TestCycleCatalog))
+    suite.addTests(loader.loadTestsFromTestCase(TestWebServer))
+    suite.addTests(loader.loadTestsFromTestCase(TestLoadGen))
+    suite.addTests(loader.loadTestsFromTestCase(TestHillClimb))
     suite.addTests(loader.loadTestsFromTestCase(TestEnigmaIntegration))
 
     # Run tests
@@ -1,6 +1,15 @@
 const alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ".split("");
 
 let sessionId = null;
+let currentState = null;
+let socket = null;
+let pendingSocketReplies = [];
+let localEngine = null;
+let unsyncedKeys = 0;
+let syncInFlight = null;
+
+// keys encrypted in the browser between position checks with the server
+const SYNC_INTERVAL_KEYS = 20;
 
 const numRotorsInput = document.getElementById("numRotors");
 const seedInput = document.getElementById("seed");
@@ -80,9 +89,14 @@ function appendTypedPair(inputLetter, outputLetter) {
 }
 
 async function postJson(url, payload) {
+  const headers = { "Content-Type": "application/json" };
+  if (payload.sessionId) {
+    // lets a multi-worker server route the request without parsing the body
+    headers["X-Enigma-Session"] = payload.sessionId;
+  }
   const response = await fetch(url, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers,
     body: JSON.stringify(payload),
   });
   if (!response.ok) {
@@ -92,6 +106,209 @@ async function postJson(url, payload) {
   return response.json();
 }
 
+function closeSocket() {
+  if (socket) {
+    socket.onclose = null;
+    socket.close();
+    socket = null;
+  }
+  pendingSocketReplies.forEach(({ reject }) => reject(new Error("Connection closed")));
+  pendingSocketReplies = [];
+}
+
+function connectSocket() {
+  closeSocket();
+  if (!("WebSocket" in window)) {
+    return;
+  }
+  const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
+  const ws = new WebSocket(`${protocol}//${window.location.host}/ws?sessionId=${encodeURIComponent(sessionId)}`);
+  ws.onmessage = (event) => {
+    // the server answers messages in order, so replies resolve first-in first-out
+    const pending = pendingSocketReplies.shift();
+    if (!pending) {
+      return;
+    }
+    const data = JSON.parse(event.data);
+    if (data.error) {
+      pending.reject(new Error(data.error));
+    } else {
+      pending.resolve(data);
+    }
+  };
+  ws.onclose = () => {
+    if (socket === ws) {
+      socket = null;
+    }
+    pendingSocketReplies.forEach(({ reject }) => reject(new Error("Connection closed")));
+    pendingSocketReplies = [];
+  };
+  socket = ws;
+}
+
+function sendSocketMessage(message) {
+  return new Promise((resolve, reject) => {
+    pendingSocketReplies.push({ resolve, reject });
+    socket.send(message);
+  });
+}
+
+function createLocalEngine(state) {
+  // mirrors EnigmaMachine's table-driven stepping and mapping from the session wiring
+  const symbols = (state.alphabet || alphabet.join("")).split("");
+  const size = symbols.length;
+  const indexOf = new Map(symbols.map((symbol, index) => [symbol, index]));
+  const toTable = (mappings) => symbols.map((symbol) => indexOf.get(mappings[symbol]));
+  const invert = (table) => {
+    const inverse = new Array(size);
+    table.forEach((mapped, index) => {
+      inverse[mapped] = index;
+    });
+    return inverse;
+  };
+  if (![state.plugboard.mappings, state.reflector.mappings, ...state.rotors.map((rotor) => rotor.mappings)].every(
+    (mappings) => mappings && Object.keys(mappings).length === size
+  )) {
+    return null;
+  }
+
+  const plugboardTable = toTable(state.plugboard.mappings);
+  const plugboardReverse = invert(plugboardTable);
+  const reflectorTable = toTable(state.reflector.mappings);
+  const rotors = state.rotors.map((rotor) => {
+    const forward = toTable(rotor.mappings);
+    return { forward, reverse: invert(forward), position: rotor.position };
+  });
+
+  function step() {
+    for (const rotor of rotors) {
+      rotor.position = (rotor.position + 1) % size;
+      if (rotor.position !== 0) {
+        break;
+      }
+    }
+  }
+
+  function encrypt(letter) {
+    const prePositions = rotors.map((rotor) => rotor.position);
+    const trace = [];
+    let index = plugboardTable[indexOf.get(letter)];
+    trace.push({ component: "plugboard", direction: "forward", from: letter, to: symbols[index] });
+
+    step();
+    rotors.forEach((rotor, rotorIndex) => {
+      const from = symbols[index];
+      index = rotor.forward[(index + rotor.position) % size];
+      trace.push({ component: "rotor", index: rotorIndex, direction: "forward", from, to: symbols[index] });
+    });
+
+    let from = symbols[index];
+    index = reflectorTable[index];
+    trace.push({ component: "reflector", from, to: symbols[index] });
+
+    for (let rotorIndex = rotors.length - 1; rotorIndex >= 0; rotorIndex -= 1) {
+      const rotor = rotors[rotorIndex];
+      from = symbols[index];
+      index = (rotor.reverse[index] - rotor.position + size) % size;
+      trace.push({ component: "rotor", index: rotorIndex, direction: "reverse", from, to: symbols[index] });
+    }
+
+    from = symbols[index];
+    index = plugboardReverse[index];
+    trace.push({ component: "plugboard", direction: "reverse", from, to: symbols[index] });
+
+    const postPositions = rotors.map((rotor) => rotor.position);
+    const steppedRotorIndices = postPositions
+      .map((position, rotorIndex) => (position !== prePositions[rotorIndex] ? rotorIndex : -1))
+      .filter((rotorIndex) => rotorIndex >= 0);
+    return {
+      input: letter,
+      output: symbols[index],
+      timeline: {
+        prePositions,
+        postPositions,
+        rotorStepped: steppedRotorIndices.length > 0,
+        steppedRotorIndices,
+      },
+      trace,
+    };
+  }
+
+  function advance(steps) {
+    for (let count = 0; count < steps; count += 1) {
+      step();
+    }
+    return rotors.map((rotor) => rotor.position);
+  }
+
+  return { encrypt, advance, accepts: (letter) => indexOf.has(letter) };
+}
+
+function syncPositions() {
+  // tell the server how many keys were encrypted locally and check it agrees on the positions
+  if (syncInFlight || !sessionId || unsyncedKeys === 0 || !currentState) {
+    return syncInFlight;
+  }
+  syncInFlight = sendSync().finally(() => {
+    syncInFlight = null;
+  });
+  return syncInFlight;
+}
+
+async function sendSync() {
+  const steps = unsyncedKeys;
+  const positions = [...currentState.rotorPositions];
+  unsyncedKeys = 0;
+  try {
+    const payload = { type: "sync", steps, positions };
+    const data =
+      socket && socket.readyState === WebSocket.OPEN
+        ? await sendSocketMessage(JSON.stringify(payload))
+        : await postJson("/api/sync", { sessionId, steps, positions });
+    if (!data.inSync) {
+      // adopt the server's state, then replay keys typed while the check was in flight
+      const typedSince = unsyncedKeys;
+      renderState(data.state);
+      if (localEngine) {
+        applyPositions(localEngine.advance(typedSince));
+        renderState(currentState);
+      }
+      unsyncedKeys = typedSince;
+      setTimelineText("Rotor positions resynchronised with the server.");
+    }
+  } catch (error) {
+    unsyncedKeys += steps;
+  }
+}
+
+function applyPositions(positions) {
+  currentState.rotorPositions = positions;
+  currentState.rotors.forEach((rotor, index) => {
+    rotor.position = positions[index];
+  });
+  return currentState;
+}
+
+async function requestKeypress(letter) {
+  // encrypt in the browser when possible; the server only checks positions every few keys
+  if (localEngine && localEngine.accepts(letter)) {
+    const data = localEngine.encrypt(letter);
+    data.state = applyPositions(data.timeline.postPositions);
+    unsyncedKeys += 1;
+    if (unsyncedKeys >= SYNC_INTERVAL_KEYS) {
+      syncPositions();
+    }
+    return data;
+  }
+  // otherwise live typing goes over the WebSocket when it is open; replies carry positions, not the full state
+  if (socket && socket.readyState === WebSocket.OPEN && currentState) {
+    const data = await sendSocketMessage(letter);
+    data.state = applyPositions(data.timeline.postPositions);
+    return data;
+  }
+  return postJson("/api/keypress", { sessionId, letter });
+}
+
 function renderKeyboard() {
   keyboard.innerHTML = "";
   alphabet.forEach((letter) => {
@@ -111,6 +328,11 @@ function renderKeyboard() {
 }
 
 function renderState(state) {
+  if (state !== currentState) {
+    currentState = state;
+    localEngine = createLocalEngine(state);
+    unsyncedKeys = 0;
+  }
   reflectorDisplay.innerHTML = "";
   const seenReflectorLetters = new Set();
   Object.keys(state.reflector.mappings)
@@ -274,6 +496,7 @@ async function startSession() {
   const data = await postJson("/api/session", payload);
   sessionId = data.sessionId;
   renderState(data.state);
+  connectSocket();
   setSessionEnabled(true);
   setBusyState(false);
   const startPositions = data.state.rotorPositions.join(", ");
@@ -296,7 +519,7 @@ async function encryptKey(letter, options = {}) {
     return;
   }
   setBusyState(true);
-  const data = await postJson("/api/keypress", { sessionId, letter });
+  const data = await requestKeypress(letter);
   lastInput.textContent = data.input;
   lastOutput.textContent = data.output;
   if (appendToBoxes) {
@@ -331,7 +554,7 @@ async function encryptMessage() {
       continue;
     }
 
-    const data = await postJson("/api/keypress", { sessionId, letter: character });
+    const data = await requestKeypress(character);
     lastInput.textContent = data.input;
     lastOutput.textContent = data.output;
     output.push(data.output);
@@ -346,6 +569,7 @@ async function encryptMessage() {
 
   setTimelineText("Message encrypted with animated key sequence.");
   setBusyState(false);
+  syncPositions();
 }
 
 async function resetRotors() {
@@ -354,6 +578,10 @@ async function resetRotors() {
     return;
   }
   setBusyState(true);
+  if (syncInFlight) {
+    // let an in-flight position check land before the server resets
+    await syncInFlight;
+  }
   let data;
   try {
     data = await postJson("/api/reset", { sessionId });
@@ -3,9 +3,10 @@ Backend controller for web UI interaction with EnigmaMachine.
 """
 from __future__ import annotations
 
+import copy
 import uuid
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 from enigmamachine import EnigmaMachine
 
@@ -28,19 +29,21 @@ class EnigmaSession:
         num_rotors: int,
         seed: int | None = None,
         randomize_positions: bool = False,
+        id_prefix: str = "",
     ) -> "EnigmaSession":
         machine = EnigmaMachine(
             num_rotors=num_rotors,
             seed=seed,
             randomize_positions=randomize_positions,
         )
-        return cls(machine=machine, session_id=str(uuid.uuid4()), seed=seed)
+        return cls(machine=machine, session_id=f"{id_prefix}{uuid.uuid4()}", seed=seed)
 
     def snapshot(self) -> dict[str, Any]:
         return {
             "sessionId": self.session_id,
             "seed": self.seed,
             "numRotors": self.machine.num_rotors,
+            "alphabet": self.machine.alphabet.symbols,
             "rotorPositions": [rotor.current_position for rotor in self.machine.rotors],
             "rotors": [
                 {
@@ -58,12 +61,16 @@ class EnigmaSession:
             },
         }
 
-    def encrypt_keypress(self, letter: str) -> dict[str, Any]:
+    def encrypt_keypress(self, letter: str, include_state: bool = True) -> dict[str, Any]:
+        """
+        Encrypt one key. Callers that already hold the wiring (the WebSocket
+        channel) pass include_state=False and track positions from the timeline.
+        """
         normalized = _normalize_letter(letter)
         pre_positions = [rotor.current_position for rotor in self.machine.rotors]
 
-        if not normalized.isalpha():
-            return {
+        if normalized not in self.machine.alphabet:
+            result = {
                 "input": letter,
                 "output": letter,
                 "timeline": {
@@ -72,8 +79,10 @@ class EnigmaSession:
                     "rotorStepped": False,
                 },
                 "trace": [],
-                "state": self.snapshot(),
             }
+            if include_state:
+                result["state"] = self.snapshot()
+            return result
 
         encryption = self.machine.encrypt_letter_with_trace(normalized)
         output = encryption["output"]
@@ -82,7 +91,7 @@ class EnigmaSession:
             index for index, (before, after) in enumerate(zip(pre_positions, post_positions)) if before != after
         ]
 
-        return {
+        result = {
             "input": normalized,
             "output": output,
             "timeline": {
@@ -92,8 +101,10 @@ class EnigmaSession:
                 "steppedRotorIndices": stepped_indices,
             },
             "trace": encryption["trace"],
-            "state": self.snapshot(),
         }
+        if include_state:
+            result["state"] = self.snapshot()
+        return result
 
     def encrypt_message(self, message: str) -> dict[str, Any]:
         input_message = message.upper()
@@ -111,6 +122,48 @@ class EnigmaSession:
             "state": self.snapshot(),
         }
 
+    def sync(self, steps: int, positions: list[int]) -> dict[str, Any]:
+        """
+        Account for keys the browser encrypted locally and check its positions.
+        The full state is only returned when the client has diverged.
+        """
+        if not isinstance(steps, int) or isinstance(steps, bool) or steps < 0:
+            raise ValueError("steps must be a non-negative integer")
+        if (
+            not isinstance(positions, list)
+            or len(positions) != self.machine.num_rotors
+            or not all(isinstance(position, int) and not isinstance(position, bool) for position in positions)
+        ):
+            raise ValueError(f"positions must be a list of {self.machine.num_rotors} integers")
+        pre_positions = [rotor.current_position for rotor in self.machine.rotors]
+        self.machine.advance(steps)
+        post_positions = [rotor.current_position for rotor in self.machine.rotors]
+        in_sync = positions == post_positions
+        result = {
+            "inSync": in_sync,
+            "timeline": {
+                "prePositions": pre_positions,
+                "postPositions": post_positions,
+            },
+        }
+        if not in_sync:
+            result["state"] = self.snapshot()
+        return result
+
+    def encrypt_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Encrypt a message piece by piece, like encrypt_message. The work runs on
+        a copy of the machine so keypresses on this session are unaffected
+        while the stream is in progress; the session's rotors are reset at the end.
+        """
+        machine = copy.deepcopy(self.machine)
+        try:
+            for chunk in chunks:
+                yield machine.encrypt_text(chunk.upper(), reset=False)
+        finally:
+            for rotor in self.machine.rotors:
+                rotor.reset_position()
+
     def reset_rotors(self) -> dict[str, Any]:
         pre_positions = [rotor.current_position for rotor in self.machine.rotors]
         for rotor in self.machine.rotors:
@@ -127,7 +180,9 @@ class EnigmaSession:
 
 
 class EnigmaSessionStore:
-    def __init__(self) -> None:
+    def __init__(self, id_prefix: str = "") -> None:
+        # multi-worker servers prefix session ids with the worker that owns them
+        self.id_prefix = id_prefix
         self._sessions: dict[str, EnigmaSession] = {}
 
     def create(
@@ -140,6 +195,7 @@ class EnigmaSessionStore:
             num_rotors=num_rotors,
             seed=seed,
             randomize_positions=randomize_positions,
+            id_prefix=self.id_prefix,
         )
         self._sessions[session.session_id] = session
         return session
@@ -1,30 +1,70 @@
 """
 Simple web server for Enigma frontend and API.
-Run with: python web_server.py
-TODO. make ports dynamic. 
+Run with: python web_server.py [--host HOST] [--port PORT] [--workers N]
 """
 from __future__ import annotations
 
+import argparse
+import codecs
 import json
+import threading
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
 
-from web_controller import EnigmaSessionStore
+from web_controller import EnigmaSession, EnigmaSessionStore
+from web_socket import (
+    OPCODE_TEXT,
+    WebSocketClosed,
+    accept_key,
+    read_message,
+    write_close,
+    write_frame,
+)
 
 
 ROOT_DIR = Path(__file__).parent
 WEB_DIR = ROOT_DIR / "web"
 SESSION_STORE = EnigmaSessionStore()
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class RequestBodyError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
 
 
 class EnigmaRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 is required for the WebSocket upgrade and keeps API connections alive
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes; with Nagle on, a kept-alive
+    # connection waits for the client's delayed ACK (~40ms) on every response
+    disable_nagle_algorithm = True
+    # kept-alive connections hold a server thread, so idle ones are closed
+    timeout = 30
+    # request body limits and concurrent stream slots, configured by run()
+    max_body_bytes = 1024 * 1024
+    max_stream_bytes = 256 * 1024 * 1024
+    stream_slots = threading.BoundedSemaphore(2)
+    # multi-worker mode closes connections after each response so every
+    # request is routed to the worker that owns its session
+    keep_alive = True
+    websocket_upgrade = False
+
+    def end_headers(self) -> None:
+        if not self.keep_alive and not self.websocket_upgrade and not self.close_connection:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
     def _send_json(self, payload: dict, status: int = HTTPStatus.OK) -> None:
         body = json.dumps(payload).encode("utf-8")
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(body)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
         self.end_headers()
         self.wfile.write(body)
 
@@ -48,21 +88,161 @@ class EnigmaRequestHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(data)
 
+    def _content_length(self, limit: int, required: bool = False) -> int:
+        if "Transfer-Encoding" in self.headers:
+            # chunked uploads are not decoded; leaving the body unread would
+            # make it look like the next request on a kept-alive connection
+            self.close_connection = True
+            raise RequestBodyError(HTTPStatus.LENGTH_REQUIRED, "Send the body with a Content-Length")
+        if required and "Content-Length" not in self.headers:
+            self.close_connection = True
+            raise RequestBodyError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        try:
+            content_length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            self.close_connection = True
+            raise RequestBodyError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if content_length > limit:
+            # the body is left unread, so the connection cannot be reused
+            self.close_connection = True
+            raise RequestBodyError(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request body exceeds the {limit} byte limit"
+            )
+        return content_length
+
     def _read_json_body(self) -> dict:
-        content_length = int(self.headers.get("Content-Length", "0"))
+        content_length = self._content_length(self.max_body_bytes)
         raw = self.rfile.read(content_length) if content_length else b"{}"
         return json.loads(raw.decode("utf-8"))
 
+    def _iter_body_text(self, content_length: int):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        remaining = content_length
+        while remaining:
+            data = self.rfile.read(min(STREAM_CHUNK_BYTES, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield decoder.decode(data)
+        yield decoder.decode(b"", final=True)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _stream_encrypt(self, session: EnigmaSession) -> None:
+        """
+        Encrypt a plain-text body as it arrives and send the result with chunked
+        transfer encoding. Each chunk is written before the next is read, so a
+        slow reader slows the encryption down instead of buffering it, and the
+        stream slots cap how many large jobs compete with keypress traffic.
+        """
+        content_length = self._content_length(self.max_stream_bytes, required=True)
+        if not self.stream_slots.acquire(blocking=False):
+            self.close_connection = True
+            self.send_response(HTTPStatus.SERVICE_UNAVAILABLE)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        stream = session.encrypt_stream(self._iter_body_text(content_length))
+        try:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for encrypted in stream:
+                if encrypted:
+                    self._write_chunk(encrypted.encode("utf-8"))
+            self._write_chunk(b"")
+        finally:
+            # resets the session rotors even if the client went away mid-stream
+            stream.close()
+            self.stream_slots.release()
+
     def _get_session(self, body: dict):
         session_id = body.get("sessionId")
         if not session_id:
             return None
         return SESSION_STORE.get(session_id)
 
+    def _handle_websocket(self, session_id: str) -> None:
+        key = self.headers.get("Sec-WebSocket-Key")
+        if self.headers.get("Upgrade", "").lower() != "websocket" or not key:
+            self.send_error(HTTPStatus.BAD_REQUEST, "Expected a WebSocket upgrade")
+            return
+        session = SESSION_STORE.get(session_id) if session_id else None
+        if session is None:
+            self.send_error(HTTPStatus.BAD_REQUEST, "Invalid or missing sessionId")
+            return
+
+        self.websocket_upgrade = True
+        self.send_response(HTTPStatus.SWITCHING_PROTOCOLS)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept_key(key))
+        self.end_headers()
+        self.close_connection = True
+        # the channel stays open while the page is, however long it idles
+        self.connection.settimeout(None)
+
+        # the session is bound to the connection, so messages carry no id
+        try:
+            while True:
+                opcode, payload = read_message(self.rfile, self.wfile)
+                if opcode == OPCODE_TEXT:
+                    try:
+                        reply = self._websocket_reply(session, payload.decode("utf-8", errors="replace"))
+                    except (ValueError, TypeError) as error:
+                        # a bad command gets an error, not a closed channel
+                        reply = {"error": str(error)}
+                else:
+                    reply = {"error": "Only text messages are supported"}
+                body = json.dumps(reply, separators=(",", ":")).encode("utf-8")
+                write_frame(self.wfile, OPCODE_TEXT, body)
+        except WebSocketClosed as closed:
+            try:
+                write_close(self.wfile, closed.code, closed.reason)
+            except OSError:
+                pass
+        except OSError:
+            pass
+
+    def _websocket_reply(self, session: EnigmaSession, message: str) -> dict:
+        # a bare character is a keypress; anything else is a JSON command
+        if len(message) == 1:
+            return session.encrypt_keypress(message, include_state=False)
+        try:
+            command = json.loads(message)
+        except json.JSONDecodeError:
+            return {"error": "Invalid JSON"}
+        if not isinstance(command, dict):
+            return {"error": "Invalid message"}
+
+        message_type = command.get("type")
+        if message_type == "keypress":
+            return session.encrypt_keypress(command.get("letter", ""), include_state=False)
+        if message_type == "sync":
+            try:
+                return session.sync(command.get("steps", 0), command.get("positions"))
+            except ValueError as error:
+                return {"error": str(error)}
+        if message_type == "reset":
+            return session.reset_rotors()
+        if message_type == "state":
+            return {"state": session.snapshot()}
+        return {"error": f"Unknown message type: {message_type}"}
+
     def do_GET(self) -> None:
         parsed = urlparse(self.path)
         path = parsed.path
 
+        if path == "/ws":
+            session_id = parse_qs(parsed.query).get("sessionId", [""])[0]
+            self._handle_websocket(session_id)
+            return
+
         if path == "/" or path == "/index.html":
             self._send_file(WEB_DIR / "index.html")
             return
@@ -79,8 +259,20 @@ class EnigmaRequestHandler(BaseHTTPRequestHandler):
         path = parsed.path
 
         try:
+            if path == "/api/encrypt/stream":
+                session_id = parse_qs(parsed.query).get("sessionId", [""])[0]
+                session = SESSION_STORE.get(session_id) if session_id else None
+                if session is None:
+                    self.close_connection = True
+                    self._send_json({"error": "Invalid or missing sessionId"}, status=HTTPStatus.BAD_REQUEST)
+                    return
+                self._stream_encrypt(session)
+                return
             body = self._read_json_body()
-        except json.JSONDecodeError:
+        except RequestBodyError as error:
+            self._send_json({"error": str(error)}, status=error.status)
+            return
+        except (json.JSONDecodeError, UnicodeDecodeError):
             self._send_json({"error": "Invalid JSON"}, status=HTTPStatus.BAD_REQUEST)
             return
 
@@ -116,6 +308,15 @@ class EnigmaRequestHandler(BaseHTTPRequestHandler):
             self._send_json(session.encrypt_message(message))
             return
 
+        if path == "/api/sync":
+            try:
+                result = session.sync(body.get("steps", 0), body.get("positions"))
+            except ValueError as error:
+                self._send_json({"error": str(error)}, status=HTTPStatus.BAD_REQUEST)
+                return
+            self._send_json(result)
+            return
+
         if path == "/api/reset":
             self._send_json(session.reset_rotors())
             return
@@ -123,9 +324,32 @@ class EnigmaRequestHandler(BaseHTTPRequestHandler):
         self.send_error(HTTPStatus.NOT_FOUND, "Route not found")
 
 
-def run() -> None:
-    host = "0.0.0.0"
-    port = 8000
+def configure(
+    max_body_bytes: int = EnigmaRequestHandler.max_body_bytes,
+    max_stream_bytes: int = EnigmaRequestHandler.max_stream_bytes,
+    max_streams: int = 2,
+) -> None:
+    EnigmaRequestHandler.max_body_bytes = max_body_bytes
+    EnigmaRequestHandler.max_stream_bytes = max_stream_bytes
+    EnigmaRequestHandler.stream_slots = threading.BoundedSemaphore(max_streams)
+
+
+def run(
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int = 1,
+    max_body_bytes: int = EnigmaRequestHandler.max_body_bytes,
+    max_stream_bytes: int = EnigmaRequestHandler.max_stream_bytes,
+    max_streams: int = 2,
+) -> None:
+    configure(max_body_bytes, max_stream_bytes, max_streams)
+    if workers > 1:
+        from web_workers import serve_workers
+        # pass the limits on: when this file runs as a script, configure()
+        # above set them on __main__, not on the web_server module workers use
+        serve_workers(host, port, workers, max_body_bytes, max_stream_bytes, max_streams)
+        return
+
     server = ThreadingHTTPServer((host, port), EnigmaRequestHandler)
     print(f"Enigma web app running at http://{host}:{port}")
     try:
@@ -136,5 +360,19 @@ def run() -> None:
         server.server_close()
 
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Enigma web app")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (sessions are pinned to one)")
+    parser.add_argument("--max-body-bytes", type=int, default=EnigmaRequestHandler.max_body_bytes,
+                        help="Largest JSON request body accepted")
+    parser.add_argument("--max-stream-bytes", type=int, default=EnigmaRequestHandler.max_stream_bytes,
+                        help="Largest body accepted by /api/encrypt/stream")
+    parser.add_argument("--max-streams", type=int, default=2, help="Concurrent streams per worker")
+    args = parser.parse_args()
+    run(args.host, args.port, args.workers, args.max_body_bytes, args.max_stream_bytes, args.max_streams)
+
+
 if __name__ == "__main__":
-    run()
+    main()
@@ -0,0 +1,118 @@
+"""
+Minimal standard-library WebSocket (RFC 6455) framing for the web server.
+Only what the UI needs: text frames, ping/pong and close.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import struct
+from typing import BinaryIO
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_MESSAGE_SIZE = 64 * 1024
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_MESSAGE_TOO_BIG = 1009
+
+
+class WebSocketClosed(Exception):
+    """Raised when the peer closes the connection or breaks the protocol"""
+
+    def __init__(self, code: int = CLOSE_NORMAL, reason: str = "") -> None:
+        super().__init__(reason or f"WebSocket closed ({code})")
+        self.code = code
+        self.reason = reason
+
+
+def accept_key(key: str) -> str:
+    """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key"""
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def _read_exact(rfile: BinaryIO, size: int) -> bytes:
+    data = rfile.read(size)
+    if len(data) != size:
+        raise WebSocketClosed(reason="Connection closed mid-frame")
+    return data
+
+
+def read_frame(rfile: BinaryIO) -> tuple[bool, int, bytes]:
+    """Read one client frame, returning (fin, opcode, unmasked payload)"""
+    first, second = _read_exact(rfile, 2)
+    fin = bool(first & 0x80)
+    opcode = first & 0x0F
+    if not second & 0x80:
+        raise WebSocketClosed(CLOSE_PROTOCOL_ERROR, "Client frames must be masked")
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", _read_exact(rfile, 2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", _read_exact(rfile, 8))
+    if length > MAX_MESSAGE_SIZE:
+        raise WebSocketClosed(CLOSE_MESSAGE_TOO_BIG, "Message too big")
+    mask = _read_exact(rfile, 4)
+    payload = _read_exact(rfile, length)
+    if length:
+        # XOR with the repeating 4-byte mask, done as one big integer operation
+        repeated = (mask * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(length, "big")
+    return fin, opcode, payload
+
+
+def read_message(rfile: BinaryIO, wfile: BinaryIO) -> tuple[int, bytes]:
+    """
+    Read the next data message, reassembling fragments and answering pings.
+    Raises WebSocketClosed when the client closes the connection.
+    """
+    opcode = None
+    parts = []
+    size = 0
+    while True:
+        fin, frame_opcode, payload = read_frame(rfile)
+        if frame_opcode == OPCODE_CLOSE:
+            code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+            raise WebSocketClosed(code)
+        if frame_opcode == OPCODE_PING:
+            write_frame(wfile, OPCODE_PONG, payload)
+            continue
+        if frame_opcode == OPCODE_PONG:
+            continue
+        if frame_opcode == OPCODE_CONTINUATION:
+            if opcode is None:
+                raise WebSocketClosed(CLOSE_PROTOCOL_ERROR, "Unexpected continuation frame")
+        elif opcode is not None:
+            raise WebSocketClosed(CLOSE_PROTOCOL_ERROR, "Expected continuation frame")
+        else:
+            opcode = frame_opcode
+        size += len(payload)
+        if size > MAX_MESSAGE_SIZE:
+            raise WebSocketClosed(CLOSE_MESSAGE_TOO_BIG, "Message too big")
+        parts.append(payload)
+        if fin:
+            return opcode, b"".join(parts)
+
+
+def write_frame(wfile: BinaryIO, opcode: int, payload: bytes = b"") -> None:
+    """Write one unfragmented, unmasked server frame"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    wfile.write(header + payload)
+
+
+def write_close(wfile: BinaryIO, code: int = CLOSE_NORMAL, reason: str = "") -> None:
+    write_frame(wfile, OPCODE_CLOSE, struct.pack("!H", code) + reason.encode("utf-8")[:120])
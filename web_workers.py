@@ -0,0 +1,352 @@
+"""
+Multi-process mode for the web server.
+
+The master process owns the listening socket. For each connection it reads
+the request head (and, only when needed, a small JSON body) to find the
+session id, then hands the socket and the bytes already read to the worker
+that owns the session over a Unix socket (SCM_RIGHTS). Session ids start with
+the owning worker's index and generation ("3.0.<uuid>"); requests without a
+session, such as static files and /api/session, go to workers in turn. Each
+worker is a normal threaded HTTP server, so machines never cross process
+boundaries.
+
+Workers are fresh interpreters started with subprocess, running this module
+with their end of the channel passed in, rather than forks of the master:
+the master runs routing threads, and forking a threaded process can leave
+the child holding locks no thread will release. A worker that exits is
+restarted under the next generation. Its sessions
+died with it, so requests for them, like requests that arrive while it is
+down, get a 503 instead of a closed connection.
+"""
+from __future__ import annotations
+
+import io
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import web_server
+
+logger = logging.getLogger(__name__)
+
+HANDOFF_HEADER = struct.Struct("!I")
+MAX_HEAD_BYTES = 64 * 1024
+ROUTING_TIMEOUT = 10.0
+SESSION_HEADER = "x-enigma-session"
+RESTART_DELAY = 1.0
+
+
+def session_worker(session_id: str | None, workers: int) -> int | None:
+    """Index of the worker that owns session_id, if it names one"""
+    if not session_id:
+        return None
+    prefix, _, _ = session_id.partition(".")
+    if prefix.isdigit() and int(prefix) < workers:
+        return int(prefix)
+    return None
+
+
+def session_generation(session_id: str) -> int | None:
+    """Generation of the worker process that created session_id"""
+    _, _, rest = session_id.partition(".")
+    generation, _, _ = rest.partition(".")
+    return int(generation) if generation.isdigit() else None
+
+
+def _read_head(conn: socket.socket) -> bytes | None:
+    data = b""
+    while b"\r\n\r\n" not in data:
+        if len(data) > MAX_HEAD_BYTES:
+            return data  # let the worker reject it
+        chunk = conn.recv(8192)
+        if not chunk:
+            return data or None
+        data += chunk
+    return data
+
+
+def find_session_id(conn: socket.socket, data: bytes, max_body_bytes: int) -> tuple[str | None, bytes]:
+    """
+    Find the session a request belongs to, returning it with every byte read
+    so far. Looks at the query string and X-Enigma-Session header first and
+    only reads a JSON body when neither names the session.
+    """
+    head, _, body = data.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    request_line = lines[0].split()
+    if len(request_line) < 2:
+        return None, data
+    method, target = request_line[0], request_line[1]
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    session_id = parse_qs(urlparse(target).query).get("sessionId", [None])[0] or headers.get(SESSION_HEADER)
+    if session_id or method != "POST":
+        return session_id, data
+
+    try:
+        content_length = int(headers.get("content-length", "0"))
+    except ValueError:
+        return None, data
+    if not 0 < content_length <= max_body_bytes:
+        return None, data
+    while len(body) < content_length:
+        chunk = conn.recv(min(65536, content_length - len(body)))
+        if not chunk:
+            break
+        body += chunk
+        data += chunk
+    try:
+        payload = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None, data
+    session_id = payload.get("sessionId") if isinstance(payload, dict) else None
+    return (session_id if isinstance(session_id, str) else None), data
+
+
+class _PrefixedReader(io.RawIOBase):
+    """Replays the bytes the master already read before reading the socket"""
+
+    def __init__(self, prefix: bytes, inner: io.BufferedReader) -> None:
+        self._prefix = memoryview(prefix)
+        self._inner = inner
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._inner.read1(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _HandedOffSocket(socket.socket):
+    """Connection received from the master, with the bytes it already read"""
+    prefix = b""
+
+
+def _worker_handler(handler_class):
+    class WorkerRequestHandler(handler_class):
+        keep_alive = False
+
+        def setup(self) -> None:
+            super().setup()
+            if self.request.prefix:
+                self.rfile = io.BufferedReader(_PrefixedReader(self.request.prefix, self.rfile))
+
+    return WorkerRequestHandler
+
+
+def _recv_exact(channel: socket.socket, size: int) -> bytes | None:
+    data = b""
+    while len(data) < size:
+        chunk = channel.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _worker_main(worker_id: int, generation: int, channel: socket.socket) -> None:
+    # the master shuts workers down by closing their channels
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    web_server.SESSION_STORE.id_prefix = f"{worker_id}.{generation}."
+    server = ThreadingHTTPServer(("", 0), _worker_handler(web_server.EnigmaRequestHandler), bind_and_activate=False)
+    while True:
+        header, fds, _, _ = socket.recv_fds(channel, HANDOFF_HEADER.size, 1)
+        if not header:
+            break  # master closed the channel
+        rest = _recv_exact(channel, HANDOFF_HEADER.size - len(header)) if len(header) < HANDOFF_HEADER.size else b""
+        (prefix_length,) = HANDOFF_HEADER.unpack(header + (rest or b""))
+        prefix = _recv_exact(channel, prefix_length) if prefix_length else b""
+        if prefix is None or not fds:
+            break
+        conn = _HandedOffSocket(fileno=fds[0])
+        conn.settimeout(None)
+        conn.prefix = prefix
+        try:
+            client_address = conn.getpeername()
+        except OSError:
+            conn.close()
+            continue
+        server.process_request(conn, client_address)
+    server.server_close()
+
+
+def _worker_process(argv: list[str]) -> None:
+    """Entry point of a worker started by _WorkerPool"""
+    worker_id, generation, channel_fd, max_body_bytes, max_stream_bytes, max_streams = map(int, argv)
+    web_server.configure(max_body_bytes, max_stream_bytes, max_streams)
+    _worker_main(worker_id, generation, socket.socket(fileno=channel_fd))
+
+
+def _worker_command(worker_id: int, generation: int, channel_fd: int, limits: tuple[int, int, int]) -> list[str]:
+    return [sys.executable, os.path.abspath(__file__), str(worker_id), str(generation), str(channel_fd)] + [
+        str(limit) for limit in limits
+    ]
+
+
+class _Worker:
+    def __init__(
+        self, worker_id: int, generation: int, process: subprocess.Popen, channel: socket.socket
+    ) -> None:
+        self.worker_id = worker_id
+        self.generation = generation
+        self.process = process
+        self.channel = channel
+        self.lock = threading.Lock()
+        self.alive = True
+        self.started = time.monotonic()
+
+    def hand_off(self, conn: socket.socket, prefix: bytes) -> None:
+        with self.lock:
+            socket.send_fds(self.channel, [HANDOFF_HEADER.pack(len(prefix))], [conn.fileno()])
+            self.channel.sendall(prefix)
+
+    def close(self) -> None:
+        self.alive = False
+        with self.lock:
+            self.channel.close()
+
+
+class _WorkerPool:
+    """The worker processes, each with a thread that restarts it if it exits"""
+
+    def __init__(self, size: int, limits: tuple[int, int, int]) -> None:
+        self._limits = limits
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.workers = [self._spawn(worker_id, 0) for worker_id in range(size)]
+        self._round_robin = itertools.cycle(range(size))
+
+    def _spawn(self, worker_id: int, generation: int) -> _Worker:
+        parent_channel, child_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        with child_channel:
+            process = subprocess.Popen(
+                _worker_command(worker_id, generation, child_channel.fileno(), self._limits), pass_fds=[child_channel.fileno()]
+            )
+        worker = _Worker(worker_id, generation, process, parent_channel)
+        threading.Thread(target=self._watch, args=(worker,), daemon=True).start()
+        return worker
+
+    def _watch(self, worker: _Worker) -> None:
+        status = worker.process.wait()
+        worker.close()
+        with self._lock:
+            if self._stopping:
+                return
+        logger.warning(f"Worker {worker.worker_id} (pid {worker.process.pid}) exited with status {status}, restarting")
+        # do not spin if a worker dies as soon as it starts
+        time.sleep(max(0.0, worker.started + RESTART_DELAY - time.monotonic()))
+        with self._lock:
+            if not self._stopping:
+                self.workers[worker.worker_id] = self._spawn(worker.worker_id, worker.generation + 1)
+
+    def owner(self, session_id: str | None) -> _Worker | None:
+        """The live worker for a request, or None if the session's worker is gone"""
+        with self._lock:
+            index = session_worker(session_id, len(self.workers))
+            if index is None:
+                for _ in range(len(self.workers)):
+                    worker = self.workers[next(self._round_robin)]
+                    if worker.alive:
+                        return worker
+                return None
+            worker = self.workers[index]
+            if worker.alive and session_generation(session_id) == worker.generation:
+                return worker
+            return None
+
+    def close(self) -> None:
+        with self._lock:
+            self._stopping = True
+            workers = list(self.workers)
+        for worker in workers:
+            worker.close()
+        for worker in workers:
+            worker.process.wait()
+
+
+def _send_unavailable(conn: socket.socket, session_id: str | None) -> None:
+    if session_id:
+        message = "The worker holding this session stopped; create a new session"
+    else:
+        message = "No worker is available, try again"
+    body = json.dumps({"error": message}).encode("utf-8")
+    conn.sendall(
+        b"HTTP/1.1 503 Service Unavailable\r\n"
+        b"Content-Type: application/json\r\n"
+        b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n"
+        b"Retry-After: 1\r\n"
+        b"Connection: close\r\n\r\n" + body
+    )
+
+
+def _route(conn: socket.socket, pool: _WorkerPool, max_body_bytes: int) -> None:
+    try:
+        conn.settimeout(ROUTING_TIMEOUT)
+        data = _read_head(conn)
+        if data is None:
+            return
+        session_id, prefix = find_session_id(conn, data, max_body_bytes)
+        worker = pool.owner(session_id)
+        if worker is not None:
+            try:
+                worker.hand_off(conn, prefix)
+                return
+            except OSError:
+                worker.alive = False  # its watcher restarts it
+        _send_unavailable(conn, session_id)
+    except OSError:
+        pass
+    finally:
+        conn.close()  # the worker holds its own copy of the socket
+
+
+def serve_workers(
+    host: str,
+    port: int,
+    workers: int,
+    max_body_bytes: int = web_server.EnigmaRequestHandler.max_body_bytes,
+    max_stream_bytes: int = web_server.EnigmaRequestHandler.max_stream_bytes,
+    max_streams: int = 2,
+) -> None:
+    if not hasattr(socket, "send_fds"):
+        raise RuntimeError("Multi-worker mode needs socket.send_fds (Unix, Python 3.9+)")
+
+    listener = socket.create_server((host, port))
+    pool = _WorkerPool(workers, (max_body_bytes, max_stream_bytes, max_streams))
+    # exit cleanly on SIGTERM too, so the workers are shut down
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Enigma web app running at http://{host}:{port} with {workers} workers")
+    try:
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=_route, args=(conn, pool, max_body_bytes), daemon=True).start()
+    except KeyboardInterrupt:
+        print("\nServer stopped")
+    finally:
+        listener.close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    _worker_process(sys.argv[1:])